@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+# SIRGAS 2000 / UTM 23S: coordenadas em metros para o DF
+CRS_METROS = "EPSG:31983"
+TAMANHO_CELULA_METROS = 500
+# as 33 RAs, todas com polígono (regioes_df.geojson não tem Brasília nem Sudoeste/Octogonal)
+CAMINHO_REGIOES = 'coordenadas_poligonais/regioes_ra_df.geojson'
+COLUNA_REGIAO = 'ra'
+
+
+def carregar_regioes(caminho_geojson=CAMINHO_REGIOES, coluna=COLUNA_REGIAO):
+    """
+    Regiões administrativas com geometria válida, projetadas em metros.
+    Regiões sem polígono (nulo, vazio ou inválido) ficam de fora da
+    amostragem e são avisadas, já que nenhum ponto delas seria sorteado.
+    """
+    gdf = gpd.read_file(caminho_geojson)
+    validas = gdf['geometry'].notnull() & ~gdf['geometry'].is_empty & gdf['geometry'].is_valid
+    if not validas.all():
+        print(f"⚠️ Regiões sem polígono válido em {caminho_geojson}, fora da amostragem: "
+              f"{', '.join(map(str, gdf.loc[~validas, coluna]))}")
+    gdf = gdf[validas]
+    return gdf[[coluna, 'geometry']].rename(columns={coluna: 'regiao'}).to_crs(CRS_METROS)
+
+
+def _celulas(x, y, tamanho):
+    return np.floor(x / tamanho).astype(np.int64), np.floor(y / tamanho).astype(np.int64)
+
+
+def celulas_ocupadas(coordenadas, tamanho=TAMANHO_CELULA_METROS):
+    """
+    Células da grade que já têm ao menos uma imagem, ex. as de urban_images.
+
+    Args:
+        coordenadas (list): Lista de tuplas (lat, lon)
+    """
+    if not coordenadas:
+        return set()
+    lat, lon = np.array(coordenadas, dtype=float).T
+    pontos = gpd.GeoSeries(gpd.points_from_xy(lon, lat), crs="EPSG:4326").to_crs(CRS_METROS)
+    cx, cy = _celulas(pontos.x.to_numpy(), pontos.y.to_numpy(), tamanho)
+    return set(zip(cx.tolist(), cy.tolist()))
+
+
+def centros_das_celulas(regioes, tamanho=TAMANHO_CELULA_METROS):
+    """
+    Centro de cada célula da grade que cai dentro de uma região, como candidato
+    para células sem nenhum ponto de interesse.
+    """
+    min_x, min_y, max_x, max_y = regioes.total_bounds
+    xs = np.arange(np.floor(min_x / tamanho), np.ceil(max_x / tamanho)) * tamanho + tamanho / 2
+    ys = np.arange(np.floor(min_y / tamanho), np.ceil(max_y / tamanho)) * tamanho + tamanho / 2
+    gx, gy = np.meshgrid(xs, ys)
+    return gpd.GeoDataFrame(geometry=gpd.points_from_xy(gx.ravel(), gy.ravel()), crs=CRS_METROS)
+
+
+def amostrar_coordenadas(candidatos, regioes, tamanho=TAMANHO_CELULA_METROS, por_celula=1,
+                         por_regiao=None, ocupadas=None, preencher_vazias=False, seed=None):
+    """
+    Amostragem com cobertura uniforme: os candidatos (ex. POIs do Overpass)
+    são agrupados numa grade de `tamanho` metros sobre os polígonos das
+    regiões e até `por_celula` são sorteados em cada célula. Células em
+    `ocupadas` (já com imagens) são puladas.
+
+    Args:
+        candidatos (list | np.ndarray): Tuplas (lat, lon) ou array (n, 2)
+        regioes (GeoDataFrame): Saída de carregar_regioes
+        por_regiao (int | None): Limite de pontos por região, espalhados entre as células
+        ocupadas (set | None): Células a pular, ver celulas_ocupadas
+        preencher_vazias (bool): Usa o centro das células sem candidatos
+
+    Returns:
+        list: Lista de tuplas (lat, lon)
+    """
+    ocupadas = ocupadas or set()
+    rng = np.random.default_rng(seed)
+
+    lat, lon = np.asarray(candidatos, dtype=float).reshape(-1, 2).T
+    pontos = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326").to_crs(CRS_METROS)
+    if preencher_vazias:
+        pontos = pd.concat([pontos.assign(centro=False), centros_das_celulas(regioes, tamanho).assign(centro=True)],
+                           ignore_index=True)
+    else:
+        pontos = pontos.assign(centro=False)
+
+    # só pontos dentro de alguma região, com o nome dela
+    pontos = gpd.sjoin(pontos, regioes, how="inner", predicate="within").drop(columns="index_right")
+    pontos = pontos[~pontos.index.duplicated()]
+    cx, cy = _celulas(pontos.geometry.x.to_numpy(), pontos.geometry.y.to_numpy(), tamanho)
+    pontos = pontos.assign(cx=cx, cy=cy)
+    if ocupadas:
+        livres = [(x, y) not in ocupadas for x, y in zip(cx.tolist(), cy.tolist())]
+        pontos = pontos[np.array(livres, dtype=bool)]
+
+    # centros só entram nas células sem nenhum candidato real
+    com_candidato = pontos.loc[~pontos['centro'], ['cx', 'cy']].drop_duplicates()
+    centros = pontos[pontos['centro']].merge(com_candidato, on=['cx', 'cy'], how='left', indicator=True)
+    centros = centros[centros['_merge'] == 'left_only'].drop(columns='_merge')
+    pontos = pd.concat([pontos[~pontos['centro']], centros], ignore_index=True)
+
+    # ordem aleatória; os primeiros de cada célula são os sorteados
+    pontos = pontos.iloc[rng.permutation(len(pontos))]
+    pontos = pontos[pontos.groupby(['cx', 'cy']).cumcount() < por_celula]
+    if por_regiao is not None:
+        # rodízio entre células: a 1ª escolha de cada célula vem antes da 2ª
+        pontos = pontos.assign(rodada=pontos.groupby(['cx', 'cy']).cumcount()).sort_values('rodada', kind='stable')
+        pontos = pontos[pontos.groupby('regiao').cumcount() < por_regiao]
+
+    geograficas = gpd.GeoSeries(pontos.geometry.values, crs=CRS_METROS).to_crs("EPSG:4326")
+    return list(zip(geograficas.y.tolist(), geograficas.x.tolist()))
+
+
+def resumo_por_regiao(coordenadas, regioes):
+    """
+    Quantos pontos da amostra caem em cada região
+    """
+    if not coordenadas:
+        return {}
+    lat, lon = np.array(coordenadas, dtype=float).T
+    pontos = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326").to_crs(CRS_METROS)
+    return gpd.sjoin(pontos, regioes, how="inner", predicate="within")['regiao'].value_counts().to_dict()
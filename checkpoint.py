@@ -0,0 +1,76 @@
+import os
+import json
+import threading
+
+
+def _descartar_linha_incompleta(caminho):
+    """
+    Corta o arquivo no último "\n": uma linha sem fim de linha é uma escrita
+    interrompida, e se ficasse lá o próximo registro seria colado nela
+    """
+    with open(caminho, "rb+") as f:
+        fim = f.seek(0, os.SEEK_END)
+        if fim == 0:
+            return
+        f.seek(fim - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = fim
+        while pos > 0:
+            inicio = max(0, pos - (1 << 16))
+            f.seek(inicio)
+            i = f.read(pos - inicio).rfind(b"\n")
+            if i >= 0:
+                f.truncate(inicio + i + 1)
+                break
+            pos = inicio
+        else:
+            f.truncate(0)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class Checkpoint:
+    """
+    Registro append-only (JSONL) das imagens já ingeridas, uma linha por
+    imagem, sincronizado com o disco (fsync) a cada escrita. Uma execução
+    interrompida recomeça pulando o que está no arquivo; uma última linha
+    incompleta (queda no meio da escrita) é removida ao abrir.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.concluidos = set()
+        if os.path.exists(caminho):
+            _descartar_linha_incompleta(caminho)
+            with open(caminho) as f:
+                for linha in f:
+                    try:
+                        self.concluidos.add(str(json.loads(linha)["mapillary_id"]))
+                    except (ValueError, KeyError):
+                        continue
+        self.arquivo = open(caminho, "a")
+
+    def __contains__(self, mapillary_id):
+        return str(mapillary_id) in self.concluidos
+
+    def registrar(self, mapillary_id, **dados):
+        self.registrar_varios([{"mapillary_id": mapillary_id, **dados}])
+
+    def registrar_varios(self, registros):
+        """
+        Grava várias imagens com um único fsync, ex. um lote gravado no banco.
+        Cada registro é um dict com "mapillary_id" e os demais dados.
+        """
+        with self.lock:
+            for registro in registros:
+                mapillary_id = str(registro["mapillary_id"])
+                self.concluidos.add(mapillary_id)
+                self.arquivo.write(json.dumps({**registro, "mapillary_id": mapillary_id}, default=str) + "\n")
+            self.arquivo.flush()
+            os.fsync(self.arquivo.fileno())
+
+    def close(self):
+        with self.lock:
+            self.arquivo.close()
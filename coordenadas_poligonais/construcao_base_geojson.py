@@ -1,7 +1,13 @@
+import os
+import sys
 import requests
+import numpy as np
 import geopandas as gpd
 from shapely.geometry import Polygon, MultiPolygon
-import time
+
+# overpass_cache.py fica na raiz do repositório
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from overpass_cache import iterar_elementos, geometria_do_elemento, RespostaAusenteNoCache, RespostaIncompleta
 
 def fetch_region_poly(region_name):
     print(f"  📡 Consultando {region_name}")
@@ -14,119 +20,123 @@ def fetch_region_poly(region_name):
     out geom;
     """
     
-    resp = requests.post("https://overpass-api.de/api/interpreter", data={"data": query})
-    if resp.status_code != 200:
-        print(f"  ❌ Erro na API: {resp.status_code}")
+    # Resposta lida em streaming: de cada relation só ficam os ids dos ways
+    # exteriores e de cada way direto só o array de coordenadas
+    relations_outer = []
+    direct_ways = []
+    total = 0
+    try:
+        for elem in iterar_elementos(query):
+            total += 1
+            if elem["type"] == "relation" and "members" in elem:
+                relations_outer.append([m["ref"] for m in elem["members"]
+                                        if m["role"] == "outer" and m["type"] == "way"])
+            elif elem["type"] == "way" and "geometry" in elem:
+                direct_ways.append(geometria_do_elemento(elem))
+    except (requests.RequestException, RespostaAusenteNoCache, RespostaIncompleta) as e:
+        print(f"  ❌ Erro na API: {e}")
         return None
-        
-    data = resp.json()
     
-    if not data.get("elements"):
+    if not total:
         print(f"  ⚠️ Nenhum elemento encontrado")
         return None
     
-    print(f"  ✅ Encontrados {len(data['elements'])} elementos")
+    print(f"  ✅ Encontrados {total} elementos")
     
     # Processa relations
-    for elem in data["elements"]:
-        if elem["type"] == "relation" and "members" in elem:
-            # Coleta ways do boundary exterior
-            outer_ways = [m["ref"] for m in elem["members"] if m["role"] == "outer" and m["type"] == "way"]
+    for outer_ways in relations_outer:
+        # Coleta ways do boundary exterior
+        if outer_ways:
+            # Consulta geometrias dos ways
+            way_ids = ",".join(map(str, outer_ways))
+            geom_query = f"""
+            [out:json][timeout:60];
+            way(id:{way_ids});
+            out geom;
+            """
             
-            if outer_ways:
-                # Consulta geometrias dos ways
-                way_ids = ",".join(map(str, outer_ways))
-                geom_query = f"""
-                [out:json][timeout:60];
-                way(id:{way_ids});
-                out geom;
-                """
-                
-                geom_resp = requests.post("https://overpass-api.de/api/interpreter", data={"data": geom_query})
-                if geom_resp.status_code == 200:
-                    geom_data = geom_resp.json()
-                    
-                    # Coleta todos os ways com suas coordenadas
-                    ways_data = {}
-                    for way in geom_data.get("elements", []):
-                        if "geometry" in way:
-                            coords = [(pt["lon"], pt["lat"]) for pt in way["geometry"]]
-                            ways_data[way["id"]] = coords
+            # Coleta todos os ways com suas coordenadas (arrays lon, lat)
+            ways_data = {}
+            try:
+                for way in iterar_elementos(geom_query):
+                    if "geometry" in way:
+                        ways_data[way["id"]] = geometria_do_elemento(way)
+            except (requests.RequestException, RespostaAusenteNoCache, RespostaIncompleta) as e:
+                print(f"  ❌ Erro na API: {e}")
+                ways_data = {}
+            
+            # Tenta conectar os ways em ordem
+            if ways_data:
+                try:
+                    # Começa com o primeiro way
+                    first_way_id = next(iter(ways_data))
+                    connected = [ways_data[first_way_id]]
+                    used_ways = {first_way_id}
                     
-                    # Tenta conectar os ways em ordem
-                    if ways_data:
-                        try:
-                            # Começa com o primeiro way
-                            first_way_id = list(ways_data.keys())[0]
-                            connected_coords = ways_data[first_way_id][:]
-                            used_ways = {first_way_id}
-                            
-                            # Tenta conectar os outros ways
-                            while len(used_ways) < len(ways_data):
-                                last_point = connected_coords[-1]
-                                found_connection = False
-                                
-                                for way_id, coords in ways_data.items():
-                                    if way_id in used_ways:
-                                        continue
-                                    
-                                    # Verifica se este way conecta ao final da linha atual
-                                    if coords[0] == last_point:
-                                        connected_coords.extend(coords[1:])  # Remove primeiro ponto (duplicado)
-                                        used_ways.add(way_id)
-                                        found_connection = True
-                                        break
-                                    elif coords[-1] == last_point:
-                                        # Way está na direção oposta
-                                        connected_coords.extend(reversed(coords[:-1]))  # Remove último ponto e inverte
-                                        used_ways.add(way_id)
-                                        found_connection = True
-                                        break
-                                
-                                if not found_connection:
-                                    # Se não conseguiu conectar, tenta uma abordagem mais simples
-                                    print(f"  ⚠️ Não conseguiu conectar todos os ways, usando abordagem simples")
-                                    all_coords = []
-                                    for coords in ways_data.values():
-                                        all_coords.extend(coords[:-1])  # Remove último ponto para evitar duplicação
-                                    
-                                    if all_coords and len(all_coords) >= 3:
-                                        all_coords.append(all_coords[0])  # Fecha o polígono
-                                        poly = Polygon(all_coords)
-                                        if poly.is_valid and poly.area > 0:
-                                            print(f"  🎯 Polígono criado (método simples)!")
-                                            return poly
-                                    break
+                    # Tenta conectar os outros ways
+                    while len(used_ways) < len(ways_data):
+                        last_point = connected[-1][-1]
+                        found_connection = False
+                        
+                        for way_id, coords in ways_data.items():
+                            if way_id in used_ways:
+                                continue
                             
-                            # Fecha o polígono se necessário
-                            if connected_coords and connected_coords[0] != connected_coords[-1]:
-                                connected_coords.append(connected_coords[0])
+                            # Verifica se este way conecta ao final da linha atual
+                            if np.array_equal(coords[0], last_point):
+                                connected.append(coords[1:])  # Remove primeiro ponto (duplicado)
+                                used_ways.add(way_id)
+                                found_connection = True
+                                break
+                            elif np.array_equal(coords[-1], last_point):
+                                # Way está na direção oposta
+                                connected.append(coords[-2::-1])  # Remove último ponto e inverte
+                                used_ways.add(way_id)
+                                found_connection = True
+                                break
+                        
+                        if not found_connection:
+                            # Se não conseguiu conectar, tenta uma abordagem mais simples
+                            print(f"  ⚠️ Não conseguiu conectar todos os ways, usando abordagem simples")
+                            # Remove último ponto de cada way para evitar duplicação
+                            all_coords = np.concatenate([coords[:-1] for coords in ways_data.values()])
                             
-                            if len(connected_coords) >= 4:
-                                poly = Polygon(connected_coords)
+                            if len(all_coords) >= 3:
+                                all_coords = np.vstack([all_coords, all_coords[:1]])  # Fecha o polígono
+                                poly = Polygon(all_coords)
                                 if poly.is_valid and poly.area > 0:
-                                    print(f"  🎯 Polígono criado (método conectado)!")
+                                    print(f"  🎯 Polígono criado (método simples)!")
                                     return poly
-                                else:
-                                    print(f"  ⚠️ Polígono inválido ou sem área")
-                        
-                        except Exception as e:
-                            print(f"  ⚠️ Erro ao conectar ways: {e}")
+                            break
+                    
+                    connected_coords = np.concatenate(connected)
+                    # Fecha o polígono se necessário
+                    if len(connected_coords) and not np.array_equal(connected_coords[0], connected_coords[-1]):
+                        connected_coords = np.vstack([connected_coords, connected_coords[:1]])
+                    
+                    if len(connected_coords) >= 4:
+                        poly = Polygon(connected_coords)
+                        if poly.is_valid and poly.area > 0:
+                            print(f"  🎯 Polígono criado (método conectado)!")
+                            return poly
+                        else:
+                            print(f"  ⚠️ Polígono inválido ou sem área")
+                
+                except Exception as e:
+                    print(f"  ⚠️ Erro ao conectar ways: {e}")
     
     # Fallback para ways diretos
     polys = []
-    for elem in data["elements"]:
-        if elem["type"] == "way" and "geometry" in elem:
-            coords = [(pt["lon"], pt["lat"]) for pt in elem["geometry"]]
-            if len(coords) >= 4:
-                if coords[0] != coords[-1]:
-                    coords.append(coords[0])
-                try:
-                    poly = Polygon(coords)
-                    if poly.is_valid and poly.area > 0:
-                        polys.append(poly)
-                except Exception as e:
-                    print(f"  ⚠️ Erro: {e}")
+    for coords in direct_ways:
+        if len(coords) >= 4:
+            if not np.array_equal(coords[0], coords[-1]):
+                coords = np.vstack([coords, coords[:1]])
+            try:
+                poly = Polygon(coords)
+                if poly.is_valid and poly.area > 0:
+                    polys.append(poly)
+            except Exception as e:
+                print(f"  ⚠️ Erro: {e}")
     
     if not polys:
         print(f"  ❌ Nenhum polígono válido")
@@ -142,7 +152,6 @@ def build_df(regions):
         print("🔍 Buscando", name)
         geom = fetch_region_poly(name)
         records.append({"name": name, "geometry": geom})
-        time.sleep(0.5)  # Pausa para não sobrecarregar a API
     return gpd.GeoDataFrame(records, crs="EPSG:4326")
 
 regions = ["Brasília","Gama","Taguatinga","Ceilândia","Samambaia",
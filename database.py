@@ -1,10 +1,12 @@
 import os
 import uuid
+import time
+import threading
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, Table, Column, MetaData, String, Float, select
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert
 from overpass import get_regiao_administrativa
-from regioes_coordenadas import get_ra_por_coordenada
+import numpy as np
 import geopandas as gpd
 
 
@@ -27,19 +29,143 @@ urban_images = Table(
     Column("longitude", Float)
 )
 
+# place_id das imagens do Mapillary é derivado do id da imagem, então a mesma
+# imagem tem sempre o mesmo place_id (e o mesmo objeto <place_id>.jpg no MinIO)
+NAMESPACE_MAPILLARY = uuid.uuid5(uuid.NAMESPACE_URL, "https://www.mapillary.com")
+
+def place_id_do_mapillary(mapillary_id) -> uuid.UUID:
+    return uuid.uuid5(NAMESPACE_MAPILLARY, str(mapillary_id))
+
 def criar_tabela():
     metadata.create_all(engine)
 
+def place_ids_existentes(place_ids, tamanho_lote: int = 1000) -> set:
+    """
+    Quais dos place_ids já estão em urban_images, em poucas consultas.
+    """
+    place_ids = list(place_ids)
+    existentes = set()
+    with engine.connect() as conn:
+        for inicio in range(0, len(place_ids), tamanho_lote):
+            lote = place_ids[inicio:inicio + tamanho_lote]
+            result = conn.execute(select(urban_images.c.place_id).where(urban_images.c.place_id.in_(lote)))
+            existentes.update(row.place_id for row in result)
+    return existentes
+
 def salvar_registro(place_id: uuid.UUID, place_name: str, lat: float, lon: float):
-    with engine.begin() as conn:
-        conn.execute(
-            urban_images.insert().values(
-                place_id=place_id,
-                place_name=place_name,
-                latitude=lat,
-                longitude=lon
-            )
-        )
+    salvar_registros([{
+        'place_id': place_id,
+        'place_name': place_name,
+        'latitude': lat,
+        'longitude': lon
+    }])
+
+def salvar_registros(registros, conn=None) -> int:
+    """
+    Insere vários registros em urban_images num único INSERT multi-linha.
+    place_ids que já existem são ignorados (ON CONFLICT DO NOTHING), então
+    gravar a mesma imagem de novo não tem efeito.
+
+    Returns:
+        int: número de registros novos
+    """
+    if not registros:
+        return 0
+    stmt = insert(urban_images).values(list(registros)).on_conflict_do_nothing(index_elements=['place_id'])
+    if conn is None:
+        with engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+    return conn.execute(stmt).rowcount
+
+class GravadorRegistros:
+    """
+    Acumula registros de urban_images vindos de várias threads e os grava em
+    lote: quando juntar `tamanho_lote` registros, quando o mais antigo tiver
+    mais de `intervalo_segundos` (verificado por uma thread em segundo plano)
+    e ao fechar. Um lote que falha é descartado e contado em `falhas`.
+
+    apos_gravar(registros), se informado, é chamado depois do commit de cada
+    lote com os registros gravados e o `contexto` passado em adicionar(),
+    por exemplo para atualizar um checkpoint só com o que está no banco.
+    """
+
+    def __init__(self, tamanho_lote=500, intervalo_segundos=5.0, apos_gravar=None, eg=None):
+        self.engine = eg or engine
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_segundos = intervalo_segundos
+        self.apos_gravar = apos_gravar
+        self.gravados = 0
+        self.falhas = 0
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.mais_antigo = None
+        self.parar = threading.Event()
+        self.thread = threading.Thread(target=self._gravar_periodicamente, daemon=True)
+        self.thread.start()
+
+    def adicionar(self, place_id: uuid.UUID, place_name: str, lat: float, lon: float, **contexto):
+        with self.lock:
+            if self.mais_antigo is None:
+                self.mais_antigo = time.monotonic()
+            self.buffer.append(({
+                'place_id': place_id,
+                'place_name': place_name,
+                'latitude': lat,
+                'longitude': lon
+            }, contexto))
+            cheio = len(self.buffer) >= self.tamanho_lote
+        if cheio:
+            self.flush()
+
+    def _gravar_periodicamente(self):
+        while not self.parar.wait(min(1.0, self.intervalo_segundos)):
+            with self.lock:
+                vencido = self.mais_antigo is not None and \
+                    time.monotonic() - self.mais_antigo >= self.intervalo_segundos
+            if vencido:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            lote, self.buffer, self.mais_antigo = self.buffer, [], None
+        if not lote:
+            return 0
+        # um INSERT não pode tocar a mesma linha duas vezes
+        linhas = list({linha['place_id']: linha for linha, _ in lote}.values())
+        try:
+            with self.engine.begin() as conn:
+                salvar_registros(linhas, conn)
+        except Exception as e:
+            with self.lock:
+                self.falhas += len(lote)
+            print(f"❌ Erro ao gravar lote de {len(lote)} registros: {e}")
+            return 0
+        with self.lock:
+            self.gravados += len(lote)
+        print(f"💾 {len(lote)} registros gravados em urban_images")
+        if self.apos_gravar is not None:
+            self.apos_gravar([{**linha, **contexto} for linha, contexto in lote])
+        return len(lote)
+
+    def close(self):
+        self.parar.set()
+        self.thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def coordenadas_existentes(eg=None) -> list:
+    """
+    (latitude, longitude) de todas as imagens de urban_images
+    """
+    with (eg or engine).connect() as conn:
+        result = conn.execute(select(urban_images.c.latitude, urban_images.c.longitude))
+        return [(row.latitude, row.longitude) for row in result if row.latitude is not None]
 
 def obter_todos_registros(eg):
     """
@@ -62,13 +188,16 @@ def obter_todos_registros(eg):
         
         return registros
 
-def criar_tabela_com_regioes(eg, caminho_geojson: str = 'coordenadas_poligonais/regioes_df.geojson'):
+def criar_tabela_com_regioes(eg, caminho_geojson: str = 'coordenadas_poligonais/regioes_df.geojson',
+                             tamanho_lote: int = 50_000):
     """
     Cria uma nova tabela 'urban_images_regioes' com a coluna place_name 
     renomeada baseada na função get_regiao_administrativa.
     
-    Pega os dados da tabela original, descobre a região administrativa
-    baseada na latitude e longitude, e insere na nova tabela.
+    Lê a tabela original em lotes de `tamanho_lote` linhas (cursor no
+    servidor), descobre a região de todos os pontos do lote com um único
+    sjoin indexado contra os polígonos e grava o lote de uma vez. A memória
+    fica limitada ao lote; rodar de novo atualiza as regiões já gravadas.
     """
     # Definir a nova tabela
     urban_images_regioes = Table(
@@ -76,47 +205,55 @@ def criar_tabela_com_regioes(eg, caminho_geojson: str = 'coordenadas_poligonais/
         Column("place_id", PG_UUID(as_uuid=True), primary_key=True),
         Column("regiao_administrativa", String),
         Column("latitude", Float),
-        Column("longitude", Float)
+        Column("longitude", Float),
+        extend_existing=True
     )
     
     # Criar a nova tabela se não existir
     urban_images_regioes.create(eg, checkfirst=True)
-    
-    # Obter todos os registros da tabela original
-    registros_originais = obter_todos_registros(eg)
-    
-    print(f"Processando {len(registros_originais)} registros...")
 
     gdf_regioes = gpd.read_file(caminho_geojson)
+    gdf_regioes = gdf_regioes[gdf_regioes['geometry'].notnull() & gdf_regioes['geometry'].is_valid]
+    gdf_regioes = gdf_regioes[['name', 'geometry']].to_crs("EPSG:4326")
 
-    
-    # Preparar dados em lote
-    dados_lote = []
-    for i, registro in enumerate(registros_originais):
-        print(f"Processando registro {i+1}/{len(registros_originais)}...")
-        
-        # Descobrir a região administrativa baseada nas coordenadas
-        regiao = get_ra_por_coordenada(
-            registro['latitude'], 
-            registro['longitude'],
-            gdf_regioes,
-            'name'
-        )
-
-        print(f"Registro {i+1}: {registro['place_id']} - Região: {regiao}")
-        
-        dados_lote.append({
-            'place_id': registro['place_id'],
-            'regiao_administrativa': regiao,
-            'latitude': registro['latitude'],
-            'longitude': registro['longitude']
-        })
-    
-    # Inserir todos os dados em batch
-    with eg.begin() as conn:
-        conn.execute(urban_images_regioes.insert(), dados_lote)
+    stmt = insert(urban_images_regioes)
+    stmt = stmt.on_conflict_do_update(index_elements=['place_id'],
+                                      set_={'regiao_administrativa': stmt.excluded.regiao_administrativa,
+                                            'latitude': stmt.excluded.latitude,
+                                            'longitude': stmt.excluded.longitude})
+
+    total = 0
+    inicio = time.monotonic()
+    with eg.connect() as leitura:
+        result = leitura.execution_options(stream_results=True, yield_per=tamanho_lote).execute(
+            select(urban_images.c.place_id, urban_images.c.latitude, urban_images.c.longitude))
+        for linhas in result.partitions(tamanho_lote):
+            place_ids = [linha.place_id for linha in linhas]
+            lat = np.array([linha.latitude for linha in linhas], dtype=float)
+            lon = np.array([linha.longitude for linha in linhas], dtype=float)
+
+            # o índice espacial (sindex) dos polígonos é montado uma vez e reaproveitado
+            pontos = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326")
+            joined = gpd.sjoin(pontos, gdf_regioes, how="left", predicate="within")
+            # com polígonos sobrepostos fica a primeira região encontrada
+            regioes = joined[~joined.index.duplicated()]['name'].reindex(pontos.index)
+            regioes = regioes.astype(object).where(regioes.notna(), None).tolist()
+
+            dados_lote = [
+                {
+                    'place_id': place_id,
+                    'regiao_administrativa': regiao,
+                    'latitude': None if np.isnan(la) else la,
+                    'longitude': None if np.isnan(lo) else lo
+                }
+                for place_id, regiao, la, lo in zip(place_ids, regioes, lat.tolist(), lon.tolist())
+            ]
+            with eg.begin() as conn:
+                conn.execute(stmt, dados_lote)
+
+            total += len(dados_lote)
+            print(f"Processados {total} registros ({time.monotonic() - inicio:.1f}s)")
     
     print("Tabela 'urban_images_regioes' criada e populada com sucesso!")
     
     return urban_images_regioes
-
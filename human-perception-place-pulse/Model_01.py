@@ -3,25 +3,100 @@ from torch import nn
 from torchvision.models import vit_b_16, ViT_B_16_Weights
 
 
+def make_head(num_fc, num_class):
+    head = nn.Sequential(
+        nn.Linear(num_fc, 512, bias=True),
+        nn.ReLU(True),
+        nn.Linear(512, 256, bias=True),
+        nn.ReLU(True),
+        nn.Linear(256, num_class, bias=True)
+    )
+    nn.init.xavier_uniform_(head[0].weight)
+    nn.init.xavier_uniform_(head[2].weight)
+    nn.init.xavier_uniform_(head[4].weight)
+    return head
+
+
 class Net(nn.Module):
-    def __init__(self, num_class):
+    def __init__(self, num_class, pretrained=True):
         super(Net, self).__init__()
 
-        self.model = vit_b_16(weights=ViT_B_16_Weights.IMAGENET1K_SWAG_E2E_V1)
+        if pretrained:
+            self.model = vit_b_16(weights=ViT_B_16_Weights.IMAGENET1K_SWAG_E2E_V1)
+        else:
+            # same architecture as the SWAG weights, to load a state dict into
+            self.model = vit_b_16(weights=None, image_size=384)
         num_fc = self.model.heads.head.in_features
-        self.model.heads.head = nn.Sequential(
-            nn.Linear(num_fc, 512, bias=True),
-            nn.ReLU(True),
-            nn.Linear(512, 256, bias=True),
-            nn.ReLU(True),
-            nn.Linear(256, num_class, bias=True)
-        )
-        nn.init.xavier_uniform_(self.model.heads.head[0].weight)
-        nn.init.xavier_uniform_(self.model.heads.head[2].weight)
-        nn.init.xavier_uniform_(self.model.heads.head[4].weight)
+        self.model.heads.head = make_head(num_fc, num_class)
 
 
 
     def forward(self, x):
         x = self.model(x)
         return x
+
+    def features(self, x):
+        """
+        768-d CLS token of the ViT backbone, i.e. the input of heads.head;
+        classify(features(x)) == forward(x)
+        """
+        vit = self.model
+        x = vit._process_input(x)
+        batch_class_token = vit.class_token.expand(x.shape[0], -1, -1)
+        x = torch.cat([batch_class_token, x], dim=1)
+        x = vit.encoder(x)
+        return x[:, 0]
+
+    def classify(self, features):
+        return self.model.heads(features)
+
+
+class MultiHeadNet(nn.Module):
+    """
+    One ViT-B/16 backbone shared by one Net-style head per perception
+    attribute, so a single forward pass scores every attribute.
+    forward() returns {attribute: logits}.
+    """
+
+    def __init__(self, attributes, num_class=2, pretrained=True):
+        super(MultiHeadNet, self).__init__()
+
+        self.attributes = list(attributes)
+        if pretrained:
+            self.model = vit_b_16(weights=ViT_B_16_Weights.IMAGENET1K_SWAG_E2E_V1)
+        else:
+            # same architecture as the SWAG weights, without downloading them
+            self.model = vit_b_16(weights=None, image_size=384)
+        num_fc = self.model.heads.head.in_features
+        # the backbone returns the 768-d CLS token, the heads do the rest
+        self.model.heads = nn.Identity()
+        self.heads = nn.ModuleDict({p: make_head(num_fc, num_class) for p in self.attributes})
+
+    @classmethod
+    def from_teachers(cls, teachers, backbone_from=None):
+        """
+        Build a student initialised from the single-attribute Net models:
+        the backbone is copied from one teacher and every head from its own
+        teacher, so distillation starts close to the originals.
+        teachers: {attribute: Net} (optionally wrapped in DataParallel)
+        """
+        teachers = {p: getattr(m, 'module', m) for p, m in teachers.items()}
+        backbone_from = backbone_from or next(iter(teachers))
+        num_class = teachers[backbone_from].model.heads.head[-1].out_features
+
+        student = cls(list(teachers), num_class=num_class, pretrained=False)
+        backbone_state = {k: v for k, v in teachers[backbone_from].model.state_dict().items()
+                          if not k.startswith('heads.')}
+        student.model.load_state_dict(backbone_state)
+        for p, teacher in teachers.items():
+            student.heads[p].load_state_dict(teacher.model.heads.head.state_dict())
+        return student
+
+    def forward(self, x):
+        return self.classify(self.features(x))
+
+    def features(self, x):
+        return self.model(x)
+
+    def classify(self, features):
+        return {p: head(features) for p, head in self.heads.items()}
@@ -0,0 +1,95 @@
+# coding=UTF-8
+"""
+Optional CPU inference backends for the perception models. Every backend
+turns a model into a callable taking a (N, 3, 384, 384) batch and returning
+logits, so predict_batch() works with any of them.
+
+    eager        plain fp32 PyTorch (reference)
+    torchscript  traced and frozen TorchScript graph
+    compile      torch.compile
+    onnx         ONNX Runtime session on the files written by export_onnx.py
+    int8         nn.Linear layers dynamically quantized to int8
+    bf16         CPU autocast to bfloat16
+"""
+import os
+import torch
+import torch.nn as nn
+from inference import INPUT_SIZE
+
+BACKENDS = ['eager', 'torchscript', 'compile', 'onnx', 'int8', 'bf16']
+# backends that cope with MultiHeadNet's dict output
+MULTIHEAD_BACKENDS = ['eager', 'compile', 'int8', 'bf16']
+ONNX_DIR = 'onnx'
+
+
+def onnx_path(model_load_path, attribute):
+    return os.path.join(model_load_path, ONNX_DIR, f"{attribute}.onnx")
+
+
+class Bf16Autocast(nn.Module):
+    """
+    Runs the wrapped model under CPU bfloat16 autocast, returning fp32 logits
+    """
+
+    def __init__(self, model):
+        super(Bf16Autocast, self).__init__()
+        self.model = model
+        # predict_batch_multihead reads the attribute names of a MultiHeadNet
+        if hasattr(model, 'attributes'):
+            self.attributes = model.attributes
+
+    def forward(self, x):
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            out = self.model(x)
+        if isinstance(out, dict):
+            return {p: logits.float() for p, logits in out.items()}
+        return out.float()
+
+
+class OnnxModel:
+    """
+    ONNX Runtime session with the same call convention as the torch models
+    """
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        logits = self.session.run(None, {self.input_name: x.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def build_backend(name, model, model_load_path=None, attribute=None, threads=None):
+    """
+    Wrap one eval-mode model (Net or MultiHeadNet) for the given backend
+    onnx loads <model_load_path>/onnx/<attribute>.onnx instead of using model
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"backend desconhecido: {name} (opções: {', '.join(BACKENDS)})")
+    model = getattr(model, 'module', model)
+
+    if name == 'eager':
+        return model
+    if name == 'bf16':
+        return Bf16Autocast(model).eval()
+    if name == 'int8':
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8).eval()
+    if name == 'compile':
+        return torch.compile(model)
+    if name == 'torchscript':
+        example = torch.randn(1, 3, *INPUT_SIZE)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    # onnx
+    path = onnx_path(model_load_path, attribute)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} não existe, rode export_onnx.py antes")
+    return OnnxModel(path, threads)
@@ -0,0 +1,294 @@
+# coding=UTF-8
+"""
+Throughput and latency benchmark of the eval.py inference path on local
+JPEGs, without MinIO or PostgreSQL.
+
+    python benchmark.py --images ./benchmark_images --synthetic 64 \\
+        --batch-sizes 1,8,16 --threads 2,4 --json bench.json --label v1.2
+
+Every batch size x thread count runs the same PrefetchPipeline as eval.py
+(files are read from disk instead of downloaded) and reports images/sec,
+p50/p95 per-image latency (from reading the file to its scores), seconds per
+stage (download = reading the file, decode_jpeg, transform, forward_<attribute>,
+db_write) and the peak RSS of the run. DB writes go through ClassificationWriter:
+against --database-url when given (scratch tables, dropped afterwards),
+otherwise statements are only compiled for PostgreSQL, i.e. the client-side
+cost. --baseline compares against a previous JSON to spot regressions.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import threading
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import torch
+from PIL import Image
+from sqlalchemy import create_engine, Table, Column, MetaData, String, Float, DateTime
+from sqlalchemy.dialects import postgresql
+from inference import (perception, ModelRegistry, INPUT_SIZE, train_transform, list_local_images,
+                       read_local_image, predict_batch, parse_counts, _rss_bytes)
+from pipeline import PrefetchPipeline, StageTimer
+from writers import ClassificationWriter
+
+metadata = MetaData()
+
+# same columns as public.classification / public.processed_images in eval.py
+bench_classification_table = Table(
+    "benchmark_classification", metadata,
+    Column("img_path", String, primary_key=True),
+    *[Column(p, Float) for p in perception],
+)
+bench_processed_table = Table(
+    "benchmark_processed_images", metadata,
+    Column("img_path", String, primary_key=True),
+    Column("processed_at", DateTime),
+)
+
+
+class _CompileOnlyEngine:
+    """
+    Engine stand-in without a database: every statement is compiled for
+    PostgreSQL with its parameters, which is the client-side part of a write
+    """
+
+    dialect = postgresql.dialect()
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, stmt):
+        stmt.compile(dialect=self.dialect).construct_params()
+
+
+class TimedDecode:
+    """
+    Pipeline decode step timing JPEG decoding and the tensor transform apart
+    """
+
+    def __init__(self, timer, draft=False):
+        self.timer = timer
+        self.draft = draft
+
+    def __call__(self, img_data):
+        with self.timer.measure('decode_jpeg'):
+            img = Image.open(io.BytesIO(img_data))
+            if self.draft and img.format == "JPEG":
+                img.draft("RGB", INPUT_SIZE)
+            img = img.convert("RGB")
+        with self.timer.measure('transform'):
+            return train_transform(img)
+
+
+class RssSampler:
+    """
+    Background thread recording the peak resident set size while running
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+        return False
+
+
+def make_synthetic_images(images_path, count, size=(2048, 1536), seed=0):
+    """
+    Write count reproducible JPEGs the size of a Mapillary 2048 px thumbnail
+    """
+    os.makedirs(images_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    for i in range(count):
+        base = np.stack([(x * (i + 1)) % 256, (y * 3) % 256, ((x + y) // 4) % 256], axis=-1)
+        noise = rng.integers(-24, 24, size=base.shape)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(os.path.join(images_path, f"synthetic_{i:04d}.jpg"), quality=90)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile, q in 0-100
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def run_config(registry, paths, engine, batch_size, threads, options):
+    torch.set_num_threads(threads)
+    timer = StageTimer()
+    started = {}
+
+    def fetch(path):
+        started[path] = time.perf_counter()
+        return read_local_image(path)
+
+    # warm-up batch, not timed
+    warmup = [train_transform(Image.open(path).convert("RGB")) for path in paths[:batch_size]]
+    for _, model in registry.items():
+        predict_batch(model, warmup, 'cpu', batch_size)
+
+    latencies = []
+    pipeline = PrefetchPipeline(paths, fetch, decode=TimedDecode(timer, options.fast_decode),
+                                batch_size=batch_size, download_workers=options.download_workers,
+                                decode_workers=options.decode_workers, queue_depth=options.queue_depth,
+                                timer=timer)
+    start = time.perf_counter()
+    with RssSampler() as rss, ClassificationWriter(engine, bench_classification_table, bench_processed_table,
+                                                   batch_size=options.db_batch_size, flush_seconds=float('inf'),
+                                                   timer=timer) as writer:
+        for names, tensors in pipeline:
+            scores = {}
+            for p, model in registry.items():
+                with timer.measure(f'forward_{p}', len(tensors)):
+                    scores[p] = predict_batch(model, tensors, 'cpu', batch_size)
+            done = time.perf_counter()
+            for i, name in enumerate(names):
+                latencies.append(done - started[name])
+                writer.add(name, {'img_path': name, **{p: scores[p][i] for p in scores}})
+    wall = time.perf_counter() - start
+
+    processed = len(latencies)
+    return {
+        'batch_size': batch_size,
+        'threads': threads,
+        'images': processed,
+        'failed': len(pipeline.failed),
+        'wall_seconds': wall,
+        'images_per_second': processed / wall if wall else None,
+        'latency_ms': {
+            'p50': 1000 * percentile(latencies, 50) if latencies else None,
+            'p95': 1000 * percentile(latencies, 95) if latencies else None,
+        },
+        'stages': {
+            stage: {'seconds': timer.seconds[stage], 'items': timer.items[stage],
+                    'ms_per_item': 1000 * timer.seconds[stage] / timer.items[stage] if timer.items[stage] else None}
+            for stage in sorted(timer.seconds)
+        },
+        'peak_rss_mb': rss.peak / 2**20,
+    }
+
+
+def compare_to_baseline(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['batch_size'], r['threads']): r for r in json.load(f)['results']}
+    print(f"📈 Comparação com {baseline_path}:")
+    for result in results:
+        before = baseline.get((result['batch_size'], result['threads']))
+        if before is None or not before['images_per_second']:
+            continue
+        throughput = 100 * (result['images_per_second'] / before['images_per_second'] - 1)
+        p95 = 100 * (result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1)
+        print(f"  batch {result['batch_size']:>3} x {result['threads']:>2} threads: "
+              f"img/s {throughput:+6.1f}%  p95 {p95:+6.1f}%")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de throughput e latência dos modelos de percepção")
+    parser.add_argument("--images", required=True, help="diretório com as imagens JPEG de teste")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="gera N imagens sintéticas em --images se ele estiver vazio")
+    parser.add_argument("--limit", type=int, default=None, help="usa só as primeiras N imagens")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--backend", default="eager", help="backend de inferência, veja backends.py")
+    parser.add_argument("--batch-sizes", default="1,8,16")
+    parser.add_argument("--threads", default=str(torch.get_num_threads()), help="torch.set_num_threads")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--queue-depth", type=int, default=32)
+    parser.add_argument("--fast-decode", action="store_true")
+    parser.add_argument("--db-batch-size", type=int, default=64)
+    parser.add_argument("--database-url", default=None,
+                        help="PostgreSQL para medir a escrita de verdade (tabelas temporárias)")
+    parser.add_argument("--json", default=None, help="arquivo para salvar os resultados")
+    parser.add_argument("--label", default=None, help="identificação da execução, ex. a versão")
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    if args.synthetic and not list_local_images(args.images):
+        print(f"🖼️ Gerando {args.synthetic} imagens sintéticas em {args.images}...")
+        make_synthetic_images(args.images, args.synthetic)
+    paths = list_local_images(args.images)[:args.limit]
+    if not paths:
+        print(f"❌ Nenhuma imagem encontrada em {args.images}")
+        sys.exit(1)
+
+    registry = ModelRegistry(args.model_path, 'cpu').load()
+    if args.backend != "eager":
+        registry.apply_backend(args.backend)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+        metadata.create_all(engine)
+    else:
+        engine = _CompileOnlyEngine()
+
+    results = []
+    try:
+        for threads in parse_counts(args.threads):
+            for batch_size in parse_counts(args.batch_sizes):
+                print(f"⏱️ batch {batch_size}, {threads} threads...")
+                results.append(run_config(registry, paths, engine, batch_size, threads, args))
+    finally:
+        if args.database_url:
+            metadata.drop_all(engine)
+
+    print(f"📸 {len(paths)} imagens, backend {args.backend}")
+    print(f"  {'batch':>5} {'threads':>7} {'img/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'pico RSS MB':>12}")
+    for result in results:
+        print(f"  {result['batch_size']:>5} {result['threads']:>7} {result['images_per_second']:8.2f} "
+              f"{result['latency_ms']['p50']:9.1f} {result['latency_ms']['p95']:9.1f} {result['peak_rss_mb']:12.1f}")
+    for result in results:
+        print(f"  estágios, batch {result['batch_size']} x {result['threads']} threads:")
+        for stage, stats in result['stages'].items():
+            per_item = f"{stats['ms_per_item']:8.1f} ms/item" if stats['ms_per_item'] is not None else ""
+            print(f"    {stage:<18} {stats['seconds']:9.2f}s  {per_item}")
+
+    if args.baseline:
+        compare_to_baseline(results, args.baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'label': args.label,
+                'commit': _git_commit(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'torch': torch.__version__,
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'backend': args.backend,
+                'fast_decode': args.fast_decode,
+                'database': bool(args.database_url),
+                'images': len(paths),
+                'results': results,
+            }, f, indent=2)
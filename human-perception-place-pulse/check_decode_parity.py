@@ -0,0 +1,91 @@
+# coding=UTF-8
+"""
+Check that JPEG draft decoding (eval.py --fast-decode) keeps the perception
+scores within a tolerance of the full-resolution train_transform path, and
+that batched inference (predict_batch) matches scoring one image at a time.
+
+    python check_decode_parity.py --images ./test_image --tolerance 0.25
+
+Batched GEMMs are not bit-identical to single-image ones, so the batch check
+compares the positive-class probabilities with torch.allclose at --batch-atol
+(default 1e-5, well below the 0.01 rounding of the 0-10 scores).
+
+Exits with status 1 if any score moves by more than the tolerance.
+"""
+import sys
+import time
+import argparse
+import torch
+from inference import (perception, ModelRegistry, DEFAULT_BATCH_SIZE, list_local_images,
+                       read_local_image, load_image_tensor, load_image_tensor_draft, predict_all)
+
+
+def score_images(registry, paths, decode, device, batch_size):
+    scores = {p: [] for p in perception}
+    decode_seconds = 0.0
+    for start in range(0, len(paths), batch_size):
+        batch_data = [read_local_image(path) for path in paths[start:start + batch_size]]
+        decode_start = time.perf_counter()
+        tensors = [decode(img_data) for img_data in batch_data]
+        decode_seconds += time.perf_counter() - decode_start
+        for p, batch_scores in predict_all(registry, tensors, device, batch_size).items():
+            scores[p].extend(batch_scores)
+    return scores, decode_seconds
+
+
+def batch_parity(registry, paths, device, batch_size, atol):
+    """
+    Largest difference between batched and one-at-a-time probabilities per attribute
+    """
+    tensors = [load_image_tensor(read_local_image(path)) for path in paths]
+    worst = {}
+    with torch.inference_mode():
+        for p, model in registry.items():
+            single = torch.cat([torch.softmax(model(t.unsqueeze(0).to(device)), dim=1)[:, 1] for t in tensors])
+            batched = torch.cat([torch.softmax(model(torch.stack(tensors[start:start + batch_size]).to(device)),
+                                               dim=1)[:, 1]
+                                 for start in range(0, len(tensors), batch_size)])
+            worst[p] = ((single - batched).abs().max().item(), torch.allclose(single, batched, rtol=0, atol=atol))
+    return worst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara decodificação completa e em modo draft")
+    parser.add_argument("--images", required=True, help="diretório com imagens JPEG de referência")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="diferença máxima aceita por score, na escala 0-10")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--batch-atol", type=float, default=1e-5,
+                        help="diferença máxima aceita entre probabilidades em lote e uma a uma")
+    args = parser.parse_args()
+
+    paths = list_local_images(args.images)
+    if not paths:
+        print(f"❌ Nenhuma imagem encontrada em {args.images}")
+        sys.exit(1)
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    registry = ModelRegistry(args.model_path, device).load()
+
+    reference, full_seconds = score_images(registry, paths, load_image_tensor, device, args.batch_size)
+    draft, draft_seconds = score_images(registry, paths, load_image_tensor_draft, device, args.batch_size)
+
+    print(f"📸 {len(paths)} imagens")
+    print(f"⏱️ decode completo {1000 * full_seconds / len(paths):.1f} ms/imagem, "
+          f"draft {1000 * draft_seconds / len(paths):.1f} ms/imagem")
+
+    failed = False
+    for p in perception:
+        diffs = [abs(a - b) for a, b in zip(reference[p], draft[p])]
+        worst = max(diffs)
+        status = "✅" if worst <= args.tolerance else "❌"
+        failed = failed or worst > args.tolerance
+        print(f"  {status} {p:<11} diferença média {sum(diffs) / len(diffs):.3f}  máxima {worst:.2f}")
+
+    print(f"🧮 lote de {args.batch_size} vs. uma imagem por vez (atol {args.batch_atol:g})")
+    for p, (worst, close) in batch_parity(registry, paths, device, args.batch_size, args.batch_atol).items():
+        failed = failed or not close
+        print(f"  {'✅' if close else '❌'} {p:<11} diferença máxima {worst:.2e}")
+
+    sys.exit(1 if failed else 0)
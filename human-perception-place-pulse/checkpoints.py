@@ -0,0 +1,139 @@
+# coding=UTF-8
+"""
+Safetensors copies of the perception checkpoints and local model provisioning.
+
+The published .pth files pickle whole Net modules: loading one runs the
+unpickler, builds a randomly initialised ViT and copies ~330 MB into the
+process. convert_checkpoints.py writes each model's state dict once to
+<model_load_path>/safetensors/<attribute>.safetensors plus a manifest with
+SHA-256 checksums; load_safetensors_model() then builds the Net on the meta
+device and assigns the tensors read from the memory-mapped file.
+"""
+import os
+import json
+import hashlib
+import torch
+import torch.nn as nn
+from Model_01 import Net
+
+HF_REPO_ID = "Jiani11/human-perception-place-pulse"
+SAFETENSORS_DIR = 'safetensors'
+MANIFEST_FILE = 'manifest.json'
+
+
+def safetensors_path(model_load_path, attribute):
+    return os.path.join(model_load_path, SAFETENSORS_DIR, f"{attribute}.safetensors")
+
+
+def manifest_path(model_load_path):
+    return os.path.join(model_load_path, SAFETENSORS_DIR, MANIFEST_FILE)
+
+
+def file_sha256(path, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_manifest(model_load_path):
+    """
+    {attribute: {'file', 'sha256', 'size', 'mtime_ns', 'source', 'source_sha256'}},
+    empty when nothing was converted
+    """
+    try:
+        with open(manifest_path(model_load_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(model_load_path, manifest):
+    path = manifest_path(model_load_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def convert_checkpoint(model, path, source=None):
+    """
+    Write the state dict of a Net to path; returns its manifest entry
+    """
+    from safetensors.torch import save_file
+
+    model = getattr(model, 'module', model)
+    state = {name: tensor.detach().cpu().contiguous() for name, tensor in model.state_dict().items()}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    save_file(state, path, metadata={'format': 'pt'})
+    entry = {'file': os.path.basename(path), 'sha256': file_sha256(path), **_stamp(path)}
+    if source is not None:
+        entry.update(source=os.path.basename(source), source_sha256=file_sha256(source))
+    return entry
+
+
+def verify_checkpoint(path, entry, full=False):
+    """
+    True if the file at path matches its manifest entry. Unless full, a
+    file whose size and mtime match the entry is trusted without hashing,
+    so starting eval.py does not read every checkpoint twice.
+    """
+    if not os.path.exists(path):
+        return False
+    if not full and _stamp(path) == {'size': entry['size'], 'mtime_ns': entry['mtime_ns']}:
+        return True
+    return file_sha256(path) == entry['sha256']
+
+
+def load_safetensors_model(path, device):
+    """
+    Net for a converted checkpoint, in eval mode. The module is created on
+    the meta device, so no random init and no second copy of the weights;
+    load_state_dict(assign=True) takes the tensors read from the file.
+    """
+    from safetensors.torch import load_file
+
+    state = load_file(path, device=str(device))
+    num_class = state['model.heads.head.4.bias'].shape[0]
+    with torch.device('meta'):
+        model = Net(num_class, pretrained=False)
+    model.load_state_dict(state, assign=True)
+    if torch.cuda.device_count() > 1:
+        model = nn.DataParallel(model)
+    model.eval()
+    return model
+
+
+def local_models_available(model_load_path, model_files):
+    """
+    True if every model is on disk, either converted (and matching the
+    manifest) or as the original .pth
+    model_files: {attribute: .pth file name}, i.e. inference.model_dict
+    """
+    manifest = read_manifest(model_load_path)
+    for p, file_name in model_files.items():
+        entry = manifest.get(p)
+        if entry is not None and verify_checkpoint(safetensors_path(model_load_path, p), entry):
+            continue
+        if not os.path.exists(os.path.join(model_load_path, file_name)):
+            return False
+    return True
+
+
+def ensure_models(model_load_path, model_files, repo_id=HF_REPO_ID, force=False):
+    """
+    Download the checkpoints from the Hugging Face Hub unless they are
+    already in model_load_path. Returns True if the hub was called.
+    """
+    if not force and local_models_available(model_load_path, model_files):
+        return False
+    from huggingface_hub import snapshot_download
+
+    snapshot_download(repo_id=repo_id, allow_patterns=["*.pth", "README.md"], local_dir=model_load_path)
+    return True
@@ -0,0 +1,107 @@
+# coding=UTF-8
+"""
+Accuracy-parity and throughput comparison of the inference backends against
+eager fp32, on a fixed set of local images.
+
+    python compare_backends.py --images ./test_image --backends eager,int8,bf16,onnx
+
+For each backend prints images/sec over the six models plus the mean and
+maximum score difference (0-10 scale) to eager fp32. --json saves the table.
+"""
+import sys
+import json
+import time
+import argparse
+import torch
+from inference import (perception, ModelRegistry, DEFAULT_BATCH_SIZE, list_local_images,
+                       read_local_image, load_image_tensor, predict_all)
+from backends import BACKENDS, build_backend
+
+
+class _Models:
+    """
+    Minimal registry stand-in holding backend-wrapped models
+    """
+
+    def __init__(self, models):
+        self.models = models
+
+    def items(self):
+        return ((p, self.models[p]) for p in perception)
+
+
+def run(models, tensors, device, batch_size, warmup):
+    # warm-up batches: compile/trace/session setup must not count as throughput
+    for _ in range(max(warmup, 1)):
+        predict_all(models, tensors[:batch_size], device, batch_size)
+    start = time.perf_counter()
+    scores = predict_all(models, tensors, device, batch_size)
+    return scores, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara backends de inferência com eager fp32")
+    parser.add_argument("--images", required=True, help="diretório com as imagens de referência")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"lista separada por vírgulas entre {', '.join(BACKENDS)}")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", default=None, help="arquivo para salvar os resultados")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = 'cpu'
+
+    paths = list_local_images(args.images)
+    if not paths:
+        print(f"❌ Nenhuma imagem encontrada em {args.images}")
+        sys.exit(1)
+    tensors = [load_image_tensor(read_local_image(path)) for path in paths]
+
+    registry = ModelRegistry(args.model_path, device).load()
+    reference, reference_seconds = run(registry, tensors, device, args.batch_size, args.warmup)
+
+    results = []
+    for name in args.backends.split(","):
+        name = name.strip()
+        if name == 'eager':
+            scores, seconds = reference, reference_seconds
+        else:
+            try:
+                models = _Models({p: build_backend(name, registry[p], args.model_path, p, args.threads)
+                                  for p in perception})
+                scores, seconds = run(models, tensors, device, args.batch_size, args.warmup)
+                del models
+            except Exception as e:
+                print(f"❌ {name}: {e}")
+                results.append({'backend': name, 'error': str(e)})
+                continue
+
+        diffs = [abs(a - b) for p in perception for a, b in zip(reference[p], scores[p])]
+        results.append({
+            'backend': name,
+            'images_per_second': len(tensors) / seconds,
+            'speedup': reference_seconds / seconds,
+            'mean_abs_diff': sum(diffs) / len(diffs),
+            'max_abs_diff': max(diffs),
+            'max_abs_diff_per_attribute': {
+                p: max(abs(a - b) for a, b in zip(reference[p], scores[p])) for p in perception
+            },
+        })
+
+    print(f"📸 {len(tensors)} imagens, batch {args.batch_size}, {torch.get_num_threads()} threads")
+    print(f"  {'backend':<12} {'img/s':>8} {'speedup':>8} {'dif. média':>11} {'dif. máx':>9}")
+    for result in results:
+        if 'error' in result:
+            print(f"  {result['backend']:<12} erro: {result['error']}")
+            continue
+        print(f"  {result['backend']:<12} {result['images_per_second']:8.2f} {result['speedup']:7.2f}x "
+              f"{result['mean_abs_diff']:11.3f} {result['max_abs_diff']:9.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'images': len(tensors), 'batch_size': args.batch_size,
+                       'threads': torch.get_num_threads(), 'results': results}, f, indent=2)
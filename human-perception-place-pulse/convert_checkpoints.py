@@ -0,0 +1,118 @@
+# coding=UTF-8
+"""
+One-time conversion of the six perception checkpoints to safetensors.
+
+    python convert_checkpoints.py --model-path ./model
+    python convert_checkpoints.py --verify
+    python convert_checkpoints.py --measure
+
+Writes <model-path>/safetensors/<attribute>.safetensors and manifest.json
+with the SHA-256 of every file; eval.py loads them instead of the .pth files
+once they exist. --verify rehashes every converted file, --measure compares
+startup-to-first-inference of both formats in fresh processes.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import torch
+from inference import perception, model_dict, ModelRegistry, INPUT_SIZE, predict_all, _rss_bytes
+from checkpoints import (ensure_models, convert_checkpoint, read_manifest, write_manifest,
+                         safetensors_path, verify_checkpoint)
+
+
+def convert(model_load_path):
+    registry = ModelRegistry(model_load_path, 'cpu', checkpoint_format='pth').load()
+    manifest = read_manifest(model_load_path)
+    for p in perception:
+        path = safetensors_path(model_load_path, p)
+        print(f"📦 Convertendo {p} para {path}...")
+        manifest[p] = convert_checkpoint(registry[p], path, os.path.join(model_load_path, model_dict[p]))
+        write_manifest(model_load_path, manifest)
+
+        # the converted file must give back exactly the same tensors
+        converted = ModelRegistry(model_load_path, 'cpu', [p], checkpoint_format='safetensors').load()[p]
+        expected = getattr(registry[p], 'module', registry[p]).state_dict()
+        different = [name for name, tensor in converted.state_dict().items()
+                     if not torch.equal(tensor, expected[name])]
+        if different or len(expected) != len(converted.state_dict()):
+            print(f"  ❌ tensores diferentes do original: {', '.join(different) or 'chaves'}")
+            sys.exit(1)
+        print(f"  ✅ sha256 {manifest[p]['sha256'][:16]}..., {len(expected)} tensores idênticos ao .pth")
+
+
+def verify(model_load_path):
+    manifest = read_manifest(model_load_path)
+    ok = True
+    for p in perception:
+        entry = manifest.get(p)
+        if entry is None:
+            print(f"  ❌ {p}: não convertido")
+            ok = False
+        elif verify_checkpoint(safetensors_path(model_load_path, p), entry, full=True):
+            print(f"  ✅ {p}: {entry['sha256'][:16]}...")
+        else:
+            print(f"  ❌ {p}: checksum diferente do manifest")
+            ok = False
+    return ok
+
+
+def startup_probe(model_load_path, checkpoint_format):
+    """
+    Runs in a fresh interpreter: load every model and score one image
+    """
+    start = time.perf_counter()
+    registry = ModelRegistry(model_load_path, 'cpu', checkpoint_format=checkpoint_format).load()
+    loaded = time.perf_counter()
+    predict_all(registry, [torch.rand(3, *INPUT_SIZE)], 'cpu', 1)
+    print(json.dumps({
+        'load_seconds': loaded - start,
+        'first_inference_seconds': time.perf_counter() - loaded,
+        'rss_mb': _rss_bytes() / 2**20,
+    }))
+
+
+def measure(model_load_path):
+    results = {}
+    for checkpoint_format in ['pth', 'safetensors']:
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--model-path', model_load_path,
+                                 '--startup-probe', checkpoint_format],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        # includes interpreter start and imports, like a cold eval.py
+        result['process_seconds'] = time.perf_counter() - start
+        results[checkpoint_format] = result
+
+    print(f"  {'formato':<12} {'processo':>9} {'carga':>8} {'1ª inferência':>14} {'RSS MB':>8}")
+    for checkpoint_format, result in results.items():
+        print(f"  {checkpoint_format:<12} {result['process_seconds']:8.2f}s {result['load_seconds']:7.2f}s "
+              f"{result['first_inference_seconds']:13.2f}s {result['rss_mb']:8.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converte os modelos Place Pulse para safetensors")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--verify", action="store_true", help="confere o sha256 dos arquivos convertidos")
+    parser.add_argument("--measure", action="store_true",
+                        help="compara o tempo até a primeira inferência de .pth e safetensors")
+    parser.add_argument("--json", default=None, help="arquivo para salvar o resultado de --measure")
+    parser.add_argument("--startup-probe", choices=['pth', 'safetensors'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe(args.model_path, args.startup_probe)
+    elif args.verify:
+        sys.exit(0 if verify(args.model_path) else 1)
+    elif args.measure:
+        results = measure(args.model_path)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    else:
+        if ensure_models(args.model_path, model_dict):
+            print(f"⬇️ Modelos baixados em {args.model_path}")
+        convert(args.model_path)
@@ -0,0 +1,141 @@
+# coding=UTF-8
+import io
+from collections import namedtuple
+from PIL import Image
+from sqlalchemy import select
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 4
+
+Duplicate = namedtuple('Duplicate', ['img_path', 'distance', 'scores'])
+
+
+def dhash(img_data, hash_size=HASH_SIZE):
+    """
+    64-bit difference hash of an image: grayscale, shrink to 9x8 and
+    compare each pixel with its right neighbour. Near-identical frames
+    (re-encodes, small shifts, exposure changes) land a few bits apart.
+    """
+    img = Image.open(io.BytesIO(img_data)) if isinstance(img_data, bytes) else img_data
+    if img.format == "JPEG":
+        # the hash only needs a thumbnail, let the decoder downscale
+        img.draft("L", (hash_size * 8, hash_size * 8))
+    img = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def to_signed64(value):
+    """
+    Unsigned 64-bit hash -> value that fits a PostgreSQL BIGINT
+    """
+    return value - 2**64 if value >= 2**63 else value
+
+
+def from_signed64(value):
+    return value + 2**64 if value < 0 else value
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance: a radius search only visits
+    children whose edge distance is within radius of the query distance
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Returns [(distance, item)] of every entry within radius, closest first
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.append((distance, item))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+class DedupIndex:
+    """
+    Perceptual hashes of already classified images with their scores, so
+    near-duplicates reuse an existing classification instead of running the
+    models again. Keeps the counts needed to report the compute saved.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.tree = BKTree()
+        self.scores = {}
+        self.reused = 0
+        self.checked = 0
+
+    def load(self, engine, classification_table, phash_table, attributes):
+        """
+        Index every classified image that has a stored hash, in one query
+        """
+        columns = [classification_table.c[p] for p in attributes]
+        query = (select(phash_table.c.img_path, phash_table.c.phash, *columns)
+                 .join(classification_table, classification_table.c.img_path == phash_table.c.img_path))
+        with engine.connect() as conn:
+            for row in conn.execute(query):
+                scores = {p: row[2 + i] for i, p in enumerate(attributes)}
+                if None not in scores.values():
+                    self.add(from_signed64(row[1]), row[0], scores)
+        return self
+
+    def add(self, phash, img_path, scores):
+        self.tree.add(phash, img_path)
+        self.scores[img_path] = dict(scores)
+
+    def find(self, phash):
+        """
+        Closest classified image within max_distance, or None
+        """
+        self.checked += 1
+        matches = self.tree.search(phash, self.max_distance)
+        if not matches:
+            return None
+        distance, img_path = matches[0]
+        self.reused += 1
+        return Duplicate(img_path, distance, self.scores[img_path])
+
+    def report(self, seconds_per_image=None, models_per_image=6):
+        print(f"🔁 Deduplicação: {self.reused} de {self.checked} imagens reaproveitaram uma classificação "
+              f"({self.tree.size} hashes no índice)")
+        saved = f"  {self.reused * models_per_image} forward passes evitados"
+        if seconds_per_image:
+            saved += f", ~{self.reused * seconds_per_image:.1f}s de inferência"
+        print(saved)
@@ -0,0 +1,225 @@
+# coding=UTF-8
+"""
+Distill the six single-attribute Place Pulse models into one MultiHeadNet
+(one shared ViT-B/16 backbone, one head per attribute) and report how well
+the student agrees with the original checkpoints.
+
+    python distill.py --images ./corpus --epochs 3
+    python distill.py --minio --report-only
+"""
+import os
+import json
+import time
+import random
+import zlib
+import argparse
+import torch
+import torch.nn.functional as F
+from inference import (perception, ModelRegistry, MULTIHEAD_FILE, DEFAULT_BATCH_SIZE, IMAGE_EXTENSIONS,
+                       list_local_images, read_local_image, load_image_tensor,
+                       predict_batch_multihead, save_multihead, load_multihead)
+from Model_01 import MultiHeadNet
+
+
+def open_corpus(args):
+    """
+    Returns (image names, reader) for a local directory or the whole MinIO bucket
+    """
+    if args.images:
+        return list_local_images(args.images), read_local_image
+
+    # imported here so local runs do not need MinIO/PostgreSQL configured
+    from eval import minio_client, BUCKET_NAME, download_image_from_minio
+    names = [obj.object_name for obj in minio_client.list_objects(BUCKET_NAME, recursive=True)
+             if not obj.object_name.startswith('processed/')
+             and obj.object_name.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(names), download_image_from_minio
+
+
+def is_holdout(name, fraction):
+    """
+    Stable train/holdout split, so --report-only sees the same holdout set
+    """
+    return zlib.crc32(name.encode('utf-8')) % 1000 < fraction * 1000
+
+
+def load_batch(names, read):
+    loaded_names, tensors = [], []
+    for name in names:
+        img_data = read(name)
+        if img_data is None:
+            continue
+        try:
+            tensors.append(load_image_tensor(img_data))
+            loaded_names.append(name)
+        except Exception as e:
+            print(f"⚠️ Erro ao decodificar {name}: {e}, pulando...")
+    return loaded_names, tensors
+
+
+def teacher_probabilities(registry, names, read, device, batch_size):
+    """
+    Softmax outputs of every teacher for every image
+    Returns {name: tensor(len(perception), num_class)}
+    """
+    targets = {}
+    with torch.inference_mode():
+        for start in range(0, len(names), batch_size):
+            batch_names, tensors = load_batch(names[start:start + batch_size], read)
+            if not batch_names:
+                continue
+            batch = torch.stack(tensors).to(device)
+            probs = torch.stack([torch.softmax(registry[p](batch), dim=1) for p in perception], dim=1)
+            for name, image_probs in zip(batch_names, probs.cpu()):
+                targets[name] = image_probs
+            print(f"  alvos dos professores: {len(targets)}/{len(names)}")
+    return targets
+
+
+def freeze_blocks(student, n_blocks):
+    """
+    Freeze the patch embedding and the first n_blocks encoder layers
+    """
+    if n_blocks <= 0:
+        return
+    vit = student.model
+    for module in [vit.conv_proj] + list(vit.encoder.layers)[:n_blocks]:
+        for param in module.parameters():
+            param.requires_grad = False
+    vit.class_token.requires_grad = False
+    vit.encoder.pos_embedding.requires_grad = False
+
+
+def train(student, names, read, targets, device, args):
+    trainable = lambda params: [param for param in params if param.requires_grad]
+    optimizer = torch.optim.AdamW([
+        {'params': trainable(student.model.parameters()), 'lr': args.lr_backbone},
+        {'params': trainable(student.heads.parameters()), 'lr': args.lr_heads},
+    ], weight_decay=args.weight_decay)
+
+    names = [name for name in names if name in targets]
+    rng = random.Random(0)
+    student.train()
+    for epoch in range(args.epochs):
+        rng.shuffle(names)
+        epoch_loss, seen = 0.0, 0
+        start_time = time.perf_counter()
+        for start in range(0, len(names), args.batch_size):
+            batch_names, tensors = load_batch(names[start:start + args.batch_size], read)
+            if not batch_names:
+                continue
+            batch = torch.stack(tensors).to(device)
+            soft_targets = torch.stack([targets[name] for name in batch_names]).to(device)
+
+            outputs = student(batch)
+            # soft cross-entropy against each teacher's softmax
+            loss = sum(
+                -(soft_targets[:, i] * F.log_softmax(outputs[p], dim=1)).sum(dim=1).mean()
+                for i, p in enumerate(perception)
+            )
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+            epoch_loss += loss.item() * len(batch_names)
+            seen += len(batch_names)
+        print(f"📉 época {epoch + 1}/{args.epochs}: loss {epoch_loss / max(seen, 1):.4f} "
+              f"({time.perf_counter() - start_time:.0f}s)")
+    student.eval()
+    return student
+
+
+def agreement_report(student, names, read, targets, device, batch_size):
+    """
+    Per-attribute agreement between student and teachers on the 0-10 scale
+    stored in public.classification
+    """
+    errors = {p: [] for p in perception}
+    names = [name for name in names if name in targets]
+    for start in range(0, len(names), batch_size):
+        batch_names, tensors = load_batch(names[start:start + batch_size], read)
+        if not batch_names:
+            continue
+        student_scores = predict_batch_multihead(student, tensors, device, batch_size)
+        for j, name in enumerate(batch_names):
+            for i, p in enumerate(perception):
+                teacher_score = round(targets[name][i][1].item()*10, 2)
+                errors[p].append(abs(student_scores[p][j] - teacher_score))
+
+    report = {'images': len(names), 'attributes': {}}
+    for p in perception:
+        values = errors[p]
+        report['attributes'][p] = {
+            'mae': sum(values) / len(values) if values else None,
+            'max_abs_error': max(values) if values else None,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"📋 Concordância com os modelos originais ({report['images']} imagens de holdout):")
+    for p, stats in report['attributes'].items():
+        if stats['mae'] is None:
+            print(f"  {p:<11} sem imagens")
+            continue
+        print(f"  {p:<11} MAE {stats['mae']:.3f}  erro máximo {stats['max_abs_error']:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Destila os seis modelos Place Pulse em um MultiHeadNet")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images", help="diretório local com o corpus de imagens")
+    source.add_argument("--minio", action="store_true", help="usar todas as imagens do bucket MinIO")
+    parser.add_argument("--model-path", default="./model", help="diretório com os .pth originais")
+    parser.add_argument("--out", default=None, help=f"checkpoint do aluno (padrão: <model-path>/{MULTIHEAD_FILE})")
+    parser.add_argument("--report", default="./output/distill_report.json")
+    parser.add_argument("--report-only", action="store_true",
+                        help="não treina, só avalia o checkpoint existente no holdout")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--lr-backbone", type=float, default=1e-5)
+    parser.add_argument("--lr-heads", type=float, default=1e-4)
+    parser.add_argument("--weight-decay", type=float, default=0.01)
+    parser.add_argument("--freeze-blocks", type=int, default=0,
+                        help="congela as primeiras N camadas do encoder")
+    parser.add_argument("--holdout", type=float, default=0.1, help="fração do corpus usada no relatório")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(args.model_path, MULTIHEAD_FILE)
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    print("using device:{} ".format(device))
+
+    names, read = open_corpus(args)
+    if args.limit:
+        names = names[:args.limit]
+    train_names = [name for name in names if not is_holdout(name, args.holdout)]
+    holdout_names = [name for name in names if is_holdout(name, args.holdout)]
+    print(f"📸 Corpus: {len(train_names)} imagens de treino, {len(holdout_names)} de holdout")
+
+    registry = ModelRegistry(args.model_path, device).load()
+    registry.report()
+    needed = holdout_names if args.report_only else train_names + holdout_names
+    targets = teacher_probabilities(registry, needed, read, device, args.batch_size)
+
+    if args.report_only:
+        student = load_multihead(out_path, device)
+    else:
+        student = MultiHeadNet.from_teachers(registry.models).to(device)
+        # teachers are no longer needed, free their memory before training
+        del registry
+        freeze_blocks(student, args.freeze_blocks)
+        student = train(student, train_names, read, targets, device, args)
+        save_multihead(student, out_path)
+        print(f"💾 Modelo multi-cabeça salvo em {out_path}")
+
+    report = agreement_report(student, holdout_names, read, targets, device, args.batch_size)
+    report['checkpoint'] = out_path
+    print_report(report)
+
+    report_dir = os.path.dirname(args.report)
+    if report_dir and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"🗂️ Relatório salvo em {args.report}")
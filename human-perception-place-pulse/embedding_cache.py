@@ -0,0 +1,151 @@
+# coding=UTF-8
+import hashlib
+import sqlite3
+import threading
+import time
+import torch
+
+DEFAULT_MAX_BYTES = 2 * 2**30
+
+
+def content_hash(img_data):
+    """
+    Key of an image in the cache: SHA-256 of its bytes, so a renamed or
+    re-uploaded copy of the same file hits the same entry
+    """
+    return hashlib.sha256(img_data).hexdigest()
+
+
+def backbone_fingerprint(model):
+    """
+    Hash of the backbone weights only (heads excluded), so cached features
+    stay valid when only the heads change and are invalidated with the backbone
+    """
+    model = getattr(model, 'module', model)
+    digest = hashlib.sha1()
+    for name, tensor in sorted(model.state_dict().items()):
+        if 'heads.' in name:
+            continue
+        digest.update(name.encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+_readers = threading.local()
+
+
+class CachedEmbeddings:
+    """
+    Read-only check of whether an image already has an embedding for every
+    model key, used by the decode step to skip decoding images that will not
+    go through the backbone. Only the path and keys are pickled, so it can be
+    sent to decode worker processes; each thread opens its own connection.
+    """
+
+    def __init__(self, path, model_keys):
+        self.path = path
+        self.model_keys = list(model_keys)
+
+    def _connection(self):
+        connections = _readers.__dict__.setdefault('connections', {})
+        if self.path not in connections:
+            connections[self.path] = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return connections[self.path]
+
+    def __contains__(self, content_hash):
+        keys = [f"{content_hash}:{model_key}" for model_key in self.model_keys]
+        placeholders = ",".join("?" * len(keys))
+        found = self._connection().execute(
+            f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", keys).fetchone()[0]
+        return found == len(keys)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of backbone embeddings (the 768-d CLS token
+    before the heads) in one SQLite file, keyed by
+    "<image content hash>:<model key>". Vectors are stored as raw float32
+    blobs. When the stored vectors exceed max_bytes, the least recently
+    used entries are evicted down to low_watermark * max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, low_watermark=0.9):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vec BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        """
+        Returns {key: float32 tensor} for the keys present in the cache
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, vec in rows:
+                    found[key] = torch.frombuffer(bytearray(vec), dtype=torch.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        Store {key: tensor} and evict least recently used entries if needed
+        """
+        now = time.time()
+        rows = [(key, tensor.detach().float().cpu().contiguous().numpy().tobytes(), now)
+                for key, tensor in items.items()]
+        with self._lock:
+            for key, vec, _ in rows:
+                previous = self._conn.execute("SELECT LENGTH(vec) FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._size += len(vec) - (previous[0] if previous else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec, last_access) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * self.low_watermark
+        while self._size > target:
+            oldest = self._conn.execute(
+                "SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_access LIMIT 256").fetchall()
+            if not oldest:
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in oldest])
+            self._size -= sum(size for _, size in oldest)
+            self.evicted += len(oldest)
+        self._conn.commit()
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100 * self.hits / total if total else 0.0
+        print(f"🗄️ Cache de embeddings: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}%), "
+              f"{self.evicted} removidos, {self._size / 2**20:.1f} MB em {self.path}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
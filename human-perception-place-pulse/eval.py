@@ -1,17 +1,29 @@
 # coding=UTF-8
 import os
+import time
+# startup-to-first-inference is measured from here, the heavy imports included
+STARTED_AT = time.perf_counter()
+import argparse
 import pandas as pd
 import torch
-import torch.nn as nn
-from torchvision import transforms as T
-from PIL import Image
 from transformers import AutoModel
-from huggingface_hub import snapshot_download
-from Model_01 import Net  # Add this import
+from concurrent.futures import ProcessPoolExecutor
+from inference import (perception, model_dict, load_image_tensor, load_image_tensor_draft,
+                       init_decode_worker, predict_batch,
+                       predict_batch_multihead, predict_batch_cached, load_multihead, ModelRegistry,
+                       DEFAULT_BATCH_SIZE, MULTIHEAD_FILE, IMAGE_EXTENSIONS)
+from pipeline import PrefetchPipeline, StageTimer, ImageDecoder
+from writers import ClassificationWriter, BackupWriter, read_backup
+from work_queue import WorkQueue, LeaseHeartbeat, default_worker_id
+from backends import BACKENDS, MULTIHEAD_BACKENDS, build_backend
+from replicas import ReplicaPool
+from checkpoints import ensure_models
+from embedding_cache import EmbeddingCache, CachedEmbeddings, backbone_fingerprint
+from dedup import DedupIndex, DEFAULT_MAX_DISTANCE, to_signed64
 from minio import Minio
 from dotenv import load_dotenv
-import io
-from sqlalchemy import create_engine, Table, Column, MetaData, String, Float
+from sqlalchemy import (create_engine, Table, Column, MetaData, String, Float, DateTime, BigInteger,
+                        Integer, Index, select)
 from sqlalchemy.dialects.postgresql import insert
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
@@ -64,51 +76,34 @@ classification_table = Table(
     schema="public"
 )
 
-perception = ['safety', 'lively', 'wealthy',
-              'beautiful', 'boring', 'depressing']
-model_dict = {
-    'safety': 'safety.pth',
-    'lively': 'lively.pth',
-    'wealthy': 'wealthy.pth',
-    'beautiful': 'beautiful.pth',
-    'boring': 'boring.pth',
-    'depressing': 'depressing.pth',
-}
-
-
-train_transform = T.Compose([
-    T.Resize((384, 384)),
-    T.ToTensor(),
-    T.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225])
-])
-
+# Perceptual hash (dHash, signed 64-bit) of classified images, see dedup.py
+phash_table = Table(
+    "image_phash", metadata,
+    Column("img_path", String, primary_key=True),
+    Column("phash", BigInteger),
+    schema="public"
+)
 
-def predict(model, img_data, device):
-    """
-    Predict using model with image data from memory
-    img_data: bytes or PIL Image object
-    """
-    if isinstance(img_data, bytes):
-        img = Image.open(io.BytesIO(img_data))
-    else:
-        img = img_data
-    
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-    img = train_transform(img)
-    img = img.view(1, 3, 384, 384)
-    # inference
-    if device == 'cuda:0':
-        pred = model(img.cuda())
-    else:
-        pred = model(img)
-    softmax = nn.Softmax(dim=1)
-    pred = softmax(pred)[0][1].item()
-    pred = round(pred*10, 2)
+# Shared work queue of MinIO object names for eval.py --worker, see work_queue.py
+queue_table = Table(
+    "eval_queue", metadata,
+    Column("img_path", String, primary_key=True),
+    Column("status", String, nullable=False, server_default="pending"),
+    Column("lease_owner", String),
+    Column("lease_expires_at", DateTime(timezone=True)),
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column("updated_at", DateTime(timezone=True)),
+    Index("eval_queue_status_lease", "status", "lease_expires_at"),
+    schema="public"
+)
 
-    return pred
+# Manifest of processed images, keyed by MinIO object name
+processed_table = Table(
+    "processed_images", metadata,
+    Column("img_path", String, primary_key=True),
+    Column("processed_at", DateTime),
+    schema="public"
+)
 
 
 def get_object_tags(object_name):
@@ -144,57 +139,69 @@ def set_object_tag(object_name, key, value):
         return False
 
 
-def is_image_processed(object_name):
+def ensure_tables():
     """
-    Check if image was already processed by looking for a corresponding marker file
+    Create the classification and manifest tables if they do not exist
     """
-    try:
-        marker_name = f"processed/{object_name}.done"
-        minio_client.stat_object(BUCKET_NAME, marker_name)
-        return True
-    except Exception:
-        return False
+    metadata.create_all(engine)
+
+
+def get_processed_keys():
+    """
+    Keys of every image already handled, in one query: the img_path of
+    each classification row plus each object name in the manifest
+    """
+    query = select(classification_table.c.img_path).union(select(processed_table.c.img_path))
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(query)}
 
 
-def mark_image_as_processed(object_name):
+def mark_images_as_processed(object_names, conn=None):
     """
-    Mark image as processed by creating a marker file
+    Record images as processed in the manifest table
+    Pass conn to do it inside the caller's transaction
     """
+    rows = [{'img_path': name, 'processed_at': pd.Timestamp.now().to_pydatetime()}
+            for name in object_names]
+    if not rows:
+        return True
+    stmt = insert(processed_table).values(rows).on_conflict_do_nothing(index_elements=['img_path'])
     try:
-        marker_name = f"processed/{object_name}.done"
-        marker_content = f"Processed on {pd.Timestamp.now()}"
-        minio_client.put_object(
-            BUCKET_NAME, 
-            marker_name, 
-            io.BytesIO(marker_content.encode('utf-8')), 
-            len(marker_content.encode('utf-8'))
-        )
+        if conn is not None:
+            conn.execute(stmt)
+        else:
+            with engine.begin() as conn:
+                conn.execute(stmt)
         return True
     except Exception as e:
-        print(f"Erro ao criar marcador para {object_name}: {e}")
+        print(f"Erro ao registrar imagens processadas: {e}")
         return False
 
 
-def get_images_from_minio():
+def get_images_from_minio(rescore=False):
     """
-    Get list of images from MinIO bucket that are not marked as processed
+    Get list of images from MinIO bucket that are not processed yet
+    One bucket listing is compared against the processed keys fetched in
+    a single query, instead of one stat_object per image
+    rescore: list every image, processed or not; their rows are upserted
     Returns list of object names
     """
     try:
+        processed_keys = set() if rescore else get_processed_keys()
         objects = minio_client.list_objects(BUCKET_NAME, recursive=True)
         image_names = []
         processed_count = 0
         
         for obj in objects:
-            # Skip marker files
+            # Skip legacy marker files, see migrate_markers.py
             if obj.object_name.startswith('processed/'):
                 continue
                 
-            if obj.object_name.lower().endswith(('.jpg', '.jpeg', '.png')):
-                # Check if image is already processed
-                if is_image_processed(obj.object_name):
+            if obj.object_name.lower().endswith(IMAGE_EXTENSIONS):
+                # classification rows are keyed by file name, the manifest by object name
+                if (obj.object_name in processed_keys
+                        or os.path.basename(obj.object_name) in processed_keys):
                     processed_count += 1
-                    print(f"⏭️ Pulando {obj.object_name} (já processada)")
                     continue
                 
                 image_names.append(obj.object_name)
@@ -205,7 +212,7 @@ def get_images_from_minio():
         
         return image_names
     except Exception as e:
-        print(f"Erro ao listar objetos do MinIO: {e}")
+        print(f"Erro ao listar imagens pendentes: {e}")
         return []
 
 
@@ -224,126 +231,400 @@ def download_image_from_minio(object_name):
         return None
 
 
-def save_classification_to_db(image_scores):
+BACKUP_COLUMNS = ['img_path'] + perception + ['object_name']
+
+
+def classify_batch(models, tensors, device, batch_size, timer,
+                   embedding_cache=None, hashes=None, model_keys=None):
     """
-    Save classification scores to PostgreSQL database
+    Score decoded images with every perception model
+    models: a ModelRegistry, a ReplicaPool for --replicas, or a MultiHeadNet for --mode multihead
+    embedding_cache, hashes, model_keys: reuse cached backbone embeddings,
+    model_keys is {attribute: key} for a registry or one key for a MultiHeadNet
+    Returns {attribute: [score per image]}, scores are None where one model failed
+    Raises when the whole batch failed, instead of returning only None scores
     """
-    try:
-        with engine.begin() as conn:
-            # Use upsert (INSERT ... ON CONFLICT DO UPDATE)
-            stmt = insert(classification_table).values(**image_scores)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=['img_path'],
-                set_={
-                    'safety': stmt.excluded.safety,
-                    'lively': stmt.excluded.lively,
-                    'wealthy': stmt.excluded.wealthy,
-                    'beautiful': stmt.excluded.beautiful,
-                    'boring': stmt.excluded.boring,
-                    'depressing': stmt.excluded.depressing,
-                }
-            )
-            conn.execute(stmt)
-        print(f"  ✅ Dados salvos no banco para {image_scores['img_path']}")
-        return True
-    except Exception as e:
-        print(f"  ❌ Erro ao salvar no banco: {e}")
-        return False
+    if isinstance(models, ReplicaPool):
+        # The batch is split over the replica processes, each runs the six models
+        print(f"  Classificando {len(tensors)} imagens em {models.processes} processos...")
+        try:
+            with timer.measure('inference', len(tensors)):
+                return models.predict(tensors)
+        except Exception as e:
+            print(f"    ❌ Erro ao processar lote: {e}")
+            raise
+
+    if not isinstance(models, ModelRegistry):
+        # A single backbone pass scores every perception dimension
+        print(f"  Classificando {len(tensors)} imagens (multi-cabeça)...")
+        try:
+            with timer.measure('inference', len(tensors)):
+                if embedding_cache is not None:
+                    return predict_batch_cached(models, model_keys, tensors, hashes,
+                                                embedding_cache, device, batch_size)
+                return predict_batch_multihead(models, tensors, device, batch_size)
+        except Exception as e:
+            print(f"    ❌ Erro ao processar lote: {e}")
+            raise
+
+    results = {}
+    error = None
+    # Process each perception dimension over the whole batch
+    for p in perception:
+        print(f"  Classificando {len(tensors)} imagens para {p}...")
+        try:
+            with timer.measure(f'inference_{p}', len(tensors)):
+                if embedding_cache is not None:
+                    results[p] = predict_batch_cached(models[p], model_keys[p], tensors, hashes,
+                                                      embedding_cache, device, batch_size)
+                else:
+                    results[p] = predict_batch(models[p], tensors, device, batch_size)
+        except Exception as e:
+            print(f"    ❌ Erro ao processar {p}: {e}")
+            results[p] = [None] * len(tensors)
+            error = e
+    if error is not None and all(None in scores for scores in results.values()):
+        # every model failed on the whole batch: nothing would be saved, stop the run
+        raise error
+    return results
+
+
+def classify_images(image_names, models, device, options, timer, writer, backup,
+                    embedding_cache=None, model_keys=None, dedup_index=None, decode_executor=None):
+    """
+    Download, decode, classify and write a list of MinIO objects
+    options: the eval.py command line options (batch size, pipeline sizes, decode)
+    Returns (number of images processed, [(object name, failed stage)])
+    """
+    # the embedding cache is keyed by the content hash of the downloaded
+    # bytes, deduplication by their perceptual hash; images whose embeddings
+    # are all cached skip decoding, only the heads will run on them
+    cached = None
+    if embedding_cache is not None:
+        cached = CachedEmbeddings(embedding_cache.path,
+                                  model_keys.values() if isinstance(model_keys, dict) else [model_keys])
+    decode = ImageDecoder(load_image_tensor_draft if options.fast_decode else load_image_tensor,
+                          content_hash=embedding_cache is not None,
+                          perceptual_hash=dedup_index is not None,
+                          cached=cached)
+    # Downloads and decoding run in background threads while the models score
+    # the previous batch; queues are bounded so memory stays flat
+    pipeline = PrefetchPipeline(
+        image_names, download_image_from_minio,
+        decode=decode,
+        batch_size=options.batch_size,
+        download_workers=options.download_workers,
+        decode_workers=options.decode_processes or options.decode_workers,
+        queue_depth=options.queue_depth,
+        timer=timer,
+        decode_executor=decode_executor,
+    )
+    total_processed = 0
+    
+    # Process the images in batches
+    for batch_names, batch_items in pipeline:
+        print(f"Processando lote: {', '.join(batch_names)}")
+        
+        # Dictionary to store scores for each image of the batch
+        # Extract only the filename without the path
+        batch_scores = [{'img_path': os.path.basename(name)} for name in batch_names]
+        
+        to_classify = list(range(len(batch_names)))
+        if dedup_index is not None:
+            to_classify = []
+            for i, item in enumerate(batch_items):
+                duplicate = dedup_index.find(item.phash)
+                if duplicate is None:
+                    to_classify.append(i)
+                    continue
+                batch_scores[i].update(duplicate.scores)
+                print(f"  ♻️ {batch_names[i]} é quase idêntica a {duplicate.img_path} "
+                      f"(distância {duplicate.distance}), reaproveitando a classificação")
+        
+        if to_classify:
+            results = classify_batch(
+                models, [batch_items[i].tensor for i in to_classify], device, options.batch_size, timer,
+                embedding_cache, [batch_items[i].content_hash for i in to_classify], model_keys)
+            for p, scores in results.items():
+                for i, score in zip(to_classify, scores):
+                    batch_scores[i][p] = score
+        
+        for i, (img_name, image_scores) in enumerate(zip(batch_names, batch_scores)):
+            phash = batch_items[i].phash
+            print(f"  {img_name}: " + ", ".join(f"{p}={image_scores[p]}" for p in perception))
+            
+            # Only save to database if all scores are valid
+            if None not in image_scores.values():
+                # Buffered: written with the rest of its batch, together
+                # with its entry in the processed manifest
+                writer.add(img_name, image_scores, None if phash is None else to_signed64(phash))
+                if dedup_index is not None and i in to_classify:
+                    dedup_index.add(phash, image_scores['img_path'],
+                                    {p: image_scores[p] for p in perception})
+            else:
+                print(f"  ⚠️ Alguns scores inválidos para {img_name}, não salvando no banco")
+            
+            # Add to backup CSV regardless
+            backup.add({**image_scores, 'object_name': img_name})
+            
+            total_processed += 1
+            print(f"✅ {img_name} processada ({total_processed}/{len(image_names)})!")
+        
+        writer.maybe_flush()
+    
+    for img_name, stage in pipeline.failed:
+        print(f"⚠️ {img_name} pulada (falha em {stage})")
+    return total_processed, pipeline.failed
+
+
+def recover_backup(path, batch_size=64):
+    """
+    Feed the complete rows of a backup CSV back into the database, e.g. the
+    partial output of a crashed run
+    """
+    print(f"♻️ Recuperando backup {path}...")
+    skipped = 0
+    with ClassificationWriter(engine, classification_table, processed_table,
+                              batch_size=batch_size) as writer:
+        for row in read_backup(path, perception):
+            image_scores = {column: row[column] for column in ['img_path'] + perception}
+            if None in image_scores.values():
+                skipped += 1
+                continue
+            writer.add(row.get('object_name') or row['img_path'], image_scores)
+    print(f"♻️ {writer.saved} linhas reenviadas ao banco, {skipped} com scores inválidos ignoradas")
+    return writer.saved
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classifica as imagens do MinIO com os modelos Place Pulse")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="imagens por forward pass de cada modelo")
+    parser.add_argument("--download-workers", type=int, default=8,
+                        help="threads baixando objetos do MinIO em paralelo")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="threads decodificando e transformando imagens")
+    parser.add_argument("--decode-processes", type=int, default=0,
+                        help="decodifica e normaliza em um pool de N processos (0: usa as threads de decode)")
+    parser.add_argument("--fast-decode", action="store_true",
+                        help="decodificação JPEG em modo draft, perto de 384 px (ver check_decode_parity.py)")
+    parser.add_argument("--queue-depth", type=int, default=32,
+                        help="limite de imagens em cada fila do pipeline")
+    parser.add_argument("--db-batch-size", type=int, default=64,
+                        help="classificações por INSERT no banco")
+    parser.add_argument("--db-flush-seconds", type=float, default=10.0,
+                        help="tempo máximo de uma classificação no buffer antes de ir para o banco")
+    parser.add_argument("--recover-backup", metavar="CSV", default=None,
+                        help="reenvia ao banco as linhas de um backup (ex.: de uma execução interrompida) e sai")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager",
+                        help="backend de inferência em CPU (ver compare_backends.py)")
+    parser.add_argument("--embedding-cache", metavar="SQLITE", default=None,
+                        help="guarda os embeddings do backbone por hash do conteúdo; "
+                             "reavaliações só com cabeças novas pulam o ViT (backend eager)")
+    parser.add_argument("--embedding-cache-max-gb", type=float, default=2.0,
+                        help="tamanho máximo do cache de embeddings, removendo os menos usados")
+    parser.add_argument("--rescore", action="store_true",
+                        help="reclassifica todas as imagens do bucket, inclusive as já processadas, "
+                             "sobrescrevendo os scores (ex.: cabeças novas, com --embedding-cache)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="reaproveita a classificação de imagens quase idênticas (hash perceptual)")
+    parser.add_argument("--dedup-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="distância de Hamming máxima (de 64 bits) para considerar duplicata")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="coloca as imagens pendentes na fila public.eval_queue (sai, a menos que --worker)")
+    parser.add_argument("--worker", action="store_true",
+                        help="consome a fila public.eval_queue; vários workers podem rodar em paralelo")
+    parser.add_argument("--claim-size", type=int, default=64,
+                        help="imagens reservadas por vez no modo worker")
+    parser.add_argument("--lease-seconds", type=int, default=600,
+                        help="validade da reserva; itens de workers que caíram voltam para a fila depois disso")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="tentativas por imagem antes de marcá-la como failed")
+    parser.add_argument("--replicas", type=int, default=0,
+                        help="processos de inferência compartilhando os pesos em memória (0 = no processo principal)")
+    parser.add_argument("--replica-threads", type=int, default=None,
+                        help="threads por processo de inferência (padrão: CPUs / --replicas)")
+    parser.add_argument("--model-path", default="./model",
+                        help="cache local dos modelos; o Hugging Face Hub só é consultado se faltar algum")
+    parser.add_argument("--refresh-models", action="store_true",
+                        help="baixa os modelos do Hub mesmo que já estejam no cache local")
+    parser.add_argument("--checkpoint-format", choices=["auto", "pth", "safetensors"], default="auto",
+                        help="auto: safetensors convertidos por convert_checkpoints.py quando existirem")
+    parser.add_argument("--mode", choices=["separate", "multihead"], default="separate",
+                        help="separate: os seis modelos originais; multihead: um backbone destilado (distill.py)")
+    parser.add_argument("--multihead-path", default=None,
+                        help=f"checkpoint do modo multihead (padrão: ./model/{MULTIHEAD_FILE})")
+    args = parser.parse_args()
     
-    model_load_path = "./model"   # model dir path
+    model_load_path = args.model_path   # model dir path
     out_Path = "./output"     # output path
     
-    # download model
-    print("Downloading models ...")
-    snapshot_download(repo_id="Jiani11/human-perception-place-pulse",
-                      allow_patterns=["*.pth", "README.md"], local_dir=model_load_path)
-
-    # Get images from MinIO
-    print("Conectando ao MinIO e listando imagens...")
-    image_names = get_images_from_minio()
-    
-    if not image_names:
-        print("❌ Nenhuma imagem encontrada no bucket MinIO!")
+    # download model, unless already in the local cache
+    provision_start = time.perf_counter()
+    if ensure_models(model_load_path, model_dict, force=args.refresh_models):
+        print(f"⬇️ Modelos baixados do Hugging Face Hub para {model_load_path}")
+    else:
+        print(f"📁 Modelos encontrados em {model_load_path}, sem consultar o Hub")
+    provision_seconds = time.perf_counter() - provision_start
+
+    ensure_tables()
+
+    if args.rescore and (args.dedup or args.enqueue or args.worker):
+        # dedup would match every image to its own old classification, and
+        # the queue keeps done items done
+        print("❌ --rescore não combina com --dedup, --enqueue ou --worker")
         exit(1)
+
+    if args.recover_backup:
+        recover_backup(args.recover_backup, args.db_batch_size)
+        exit(0)
+
+    work_queue = WorkQueue(engine, queue_table, max_attempts=args.max_attempts)
+    if args.enqueue:
+        # Seed the shared work queue with the pending images
+        print("Conectando ao MinIO e listando imagens...")
+        work_queue.enqueue(get_images_from_minio())
+        print(f"📬 Fila de trabalho: {work_queue.counts()}")
+        if not args.worker:
+            exit(0)
     
-    print(f"📸 Encontradas {len(image_names)} imagens no bucket '{BUCKET_NAME}'")
+    if args.worker:
+        worker_id = default_worker_id()
+        print(f"👷 Worker {worker_id} consumindo a fila public.eval_queue")
+    else:
+        # Get images from MinIO
+        print("Conectando ao MinIO e listando imagens...")
+        image_names = get_images_from_minio(rescore=args.rescore)
+        
+        if not image_names:
+            print("❌ Nenhuma imagem encontrada no bucket MinIO!")
+            exit(1)
+        
+        print(f"📸 Encontradas {len(image_names)} imagens no bucket '{BUCKET_NAME}'")
 
     device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
     print("using device:{} ".format(device))
+    load_start = time.perf_counter()
+
+    if args.mode == "multihead":
+        # One shared backbone with one head per perception, see distill.py
+        multihead_path = args.multihead_path or os.path.join(model_load_path, MULTIHEAD_FILE)
+        if args.backend not in MULTIHEAD_BACKENDS:
+            print(f"❌ Backend {args.backend} não suporta o modo multihead ({', '.join(MULTIHEAD_BACKENDS)})")
+            exit(1)
+        multihead_model = build_backend(args.backend, load_multihead(multihead_path, device))
+        print(f"🧠 Modelo multi-cabeça carregado de {multihead_path}")
+    else:
+        # Load every perception model once and keep it resident for the whole run
+        registry = ModelRegistry(model_load_path, device, checkpoint_format=args.checkpoint_format).load()
+        registry.report()
+        if args.backend != "eager":
+            registry.apply_backend(args.backend)
+    print(f"⚙️ Backend de inferência: {args.backend}")
+    load_seconds = time.perf_counter() - load_start
     
-    # Check if the directory exists, if not, create it (for backup CSV)
-    if not os.path.exists(out_Path):
-        os.makedirs(out_Path)
+    embedding_cache = None
+    if args.embedding_cache:
+        if args.backend != "eager":
+            print("❌ O cache de embeddings só funciona com --backend eager")
+            exit(1)
+        embedding_cache = EmbeddingCache(args.embedding_cache, int(args.embedding_cache_max_gb * 2**30))
+        # cached features are only valid for the backbone weights that produced them
+        if args.mode == "multihead":
+            model_keys = f"multihead:{backbone_fingerprint(multihead_model)}"
+        else:
+            model_keys = {p: f"{p}:{backbone_fingerprint(model)}" for p, model in registry.items()}
+    else:
+        model_keys = None
+    models = multihead_model if args.mode == "multihead" else registry
     
-    # Counters for tracking results
-    total_processed = 0
-    total_saved_db = 0
+    replica_pool = None
+    if args.replicas > 0:
+        if args.mode == "multihead" or args.backend != "eager" or embedding_cache is not None or device.type != "cpu":
+            print("❌ --replicas só funciona em CPU com --mode separate, --backend eager e sem cache de embeddings")
+            exit(1)
+        # forked now, before the pipeline threads exist
+        replica_pool = ReplicaPool(registry, args.replicas, args.replica_threads, args.batch_size).start()
+        models = replica_pool
+        print(f"🧵 {replica_pool.processes} processos de inferência x {replica_pool.threads} threads")
     
-    # Create backup DataFrame for CSV
-    classification_df = pd.DataFrame(columns=['img_path'] + perception)
+    dedup_index = None
+    if args.dedup:
+        # near-duplicates of already classified images reuse their scores
+        dedup_index = DedupIndex(args.dedup_distance).load(engine, classification_table, phash_table, perception)
+        print(f"🔁 Índice de deduplicação com {dedup_index.tree.size} imagens classificadas")
     
-    # Process each image and save directly to database
-    for img_name in image_names:
-        print(f"Processando imagem: {img_name}")
-        
-        # Download image from MinIO
-        img_data = download_image_from_minio(img_name)
-        
-        if img_data is None:
-            print(f"⚠️ Erro ao baixar {img_name}, pulando...")
-            continue
-        
-        # Dictionary to store scores for this image
-        # Extract only the filename without the path
-        filename_only = os.path.basename(img_name)
-        image_scores = {'img_path': filename_only}
-        all_scores_valid = True
-        
-        # Process each perception dimension
-        for p in perception:
-            print(f"  Classificando para {p}...")
-            
-            # Load model for this perception
-            model_path = model_load_path + "/" + model_dict[p]
-            model = torch.load(model_path, map_location=torch.device(device), weights_only=False)
-            if torch.cuda.device_count() > 1:
-                model = nn.DataParallel(model)
-            model = model.to(device)
-            model.eval()
-            
-            try:
-                score = predict(model, img_data, device)
-                image_scores[p] = score
-                print(f"    {p}: {score}")
-            except Exception as e:
-                print(f"    ❌ Erro ao processar {p}: {e}")
-                image_scores[p] = None
-                all_scores_valid = False
-                continue
-        
-        # Only save to database if all scores are valid
-        if all_scores_valid and None not in image_scores.values():
-            if save_classification_to_db(image_scores):
-                total_saved_db += 1
-                # Mark image as processed in MinIO
-                if mark_image_as_processed(img_name):
-                    print(f"  🏷️ Imagem {img_name} marcada como processada")
-                else:
-                    print(f"  ⚠️ Erro ao marcar {img_name} como processada")
+    # Streaming backup CSV in out_Path, see --recover-backup
+    backup = BackupWriter(out_Path, BACKUP_COLUMNS)
+    print(f"🗂️ Backup em {backup.path}")
+    
+    timer = StageTimer()
+    decode_executor = None
+    if args.decode_processes > 0:
+        decode_executor = ProcessPoolExecutor(max_workers=args.decode_processes,
+                                              initializer=init_decode_worker)
+        # start the worker processes now, before the pipeline threads exist
+        decode_executor.submit(init_decode_worker).result()
+    run_start = time.perf_counter()
+    total_processed = 0
+    failed = []
+    
+    # Classifications are written to the database in multi-row batches,
+    # flushed on exit even after an error; in worker mode the queue items
+    # are completed in the same transaction
+    with backup, ClassificationWriter(engine, classification_table, processed_table,
+                                      batch_size=args.db_batch_size,
+                                      flush_seconds=args.db_flush_seconds,
+                                      timer=timer, phash_table=phash_table,
+                                      after_write=work_queue.complete if args.worker else None) as writer:
+        run_images = lambda names: classify_images(names, models, device, args, timer, writer, backup,
+                                                   embedding_cache, model_keys, dedup_index, decode_executor)
+        if args.worker:
+            with LeaseHeartbeat(work_queue, worker_id, args.lease_seconds):
+                while True:
+                    claimed = work_queue.claim(worker_id, args.claim_size, args.lease_seconds)
+                    if not claimed:
+                        print("📭 Fila vazia")
+                        break
+                    print(f"📥 {len(claimed)} imagens reservadas")
+                    processed, claim_failed = run_images(claimed)
+                    total_processed += processed
+                    failed += claim_failed
+                    # commit what was classified, then hand back the rest
+                    writer.flush()
+                    work_queue.release(worker_id, claimed)
         else:
-            print(f"  ⚠️ Alguns scores inválidos para {img_name}, não salvando no banco")
-        
-        # Add to backup DataFrame regardless
-        new_row = pd.DataFrame([image_scores])
-        classification_df = pd.concat([classification_df, new_row], ignore_index=True)
-        
-        total_processed += 1
-        print(f"✅ {img_name} processada ({total_processed}/{len(image_names)})!")
+            total_processed, failed = run_images(image_names)
+    
+    if decode_executor is not None:
+        decode_executor.shutdown()
+    if replica_pool is not None:
+        replica_pool.report()
+        replica_pool.close()
+    timer.report(time.perf_counter() - run_start)
+    first_inference = min((at for stage, at in timer.first_done.items()
+                           if stage.startswith('inference') and stage != 'inference_starved'), default=None)
+    if first_inference is not None:
+        print(f"🚀 Startup até a primeira inferência: {first_inference - STARTED_AT:.2f}s "
+              f"(modelos: provisionamento {provision_seconds:.2f}s, carga {load_seconds:.2f}s)")
+    if embedding_cache is not None:
+        embedding_cache.report()
+        embedding_cache.close()
+    if dedup_index is not None:
+        inference_seconds = sum(seconds for stage, seconds in timer.seconds.items()
+                                if stage.startswith('inference') and stage != 'inference_starved')
+        classified = dedup_index.checked - dedup_index.reused
+        dedup_index.report(inference_seconds / classified if classified else None,
+                           models_per_image=1 if args.mode == "multihead" else len(perception))
     
     print(f"\n🎉 Processamento completo!")
     print(f"📊 Total de imagens processadas: {total_processed}")
-    print(f"💾 Total salvo no banco PostgreSQL: {total_saved_db}")
+    if failed:
+        print(f"⚠️ Puladas por erro de download/decodificação: {len(failed)}")
+    print(f"💾 Total salvo no banco PostgreSQL: {writer.saved}")
+    if writer.failed:
+        print(f"⚠️ Não salvas por erro no banco: {writer.failed} (serão reprocessadas na próxima execução)")
     print(f"🗂️ Tabela do banco: public.classification")
+    print(f"🗂️ Backup: {backup.path} ({backup.rows_written} linhas)")
+    if args.worker:
+        print(f"📬 Fila de trabalho: {work_queue.counts()}")
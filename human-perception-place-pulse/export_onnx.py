@@ -0,0 +1,50 @@
+# coding=UTF-8
+"""
+Export the six perception checkpoints to ONNX for eval.py --backend onnx.
+
+    python export_onnx.py --model-path ./model
+
+Writes <model-path>/onnx/<attribute>.onnx with a dynamic batch dimension and
+checks each export against the eager model on a random batch.
+"""
+import os
+import argparse
+import torch
+from inference import perception, ModelRegistry, INPUT_SIZE
+from backends import onnx_path, OnnxModel
+
+
+def export(model, path, opset):
+    example = torch.randn(1, 3, *INPUT_SIZE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, example, path,
+            input_names=['image'], output_names=['logits'],
+            dynamic_axes={'image': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset,
+        )
+
+
+def max_difference(model, path):
+    batch = torch.randn(2, 3, *INPUT_SIZE)
+    with torch.inference_mode():
+        expected = torch.softmax(model(batch), dim=1)
+    actual = torch.softmax(OnnxModel(path)(batch), dim=1)
+    return (expected - actual).abs().max().item()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta os modelos Place Pulse para ONNX")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_path, 'cpu').load()
+    os.makedirs(os.path.join(args.model_path, 'onnx'), exist_ok=True)
+
+    for p in perception:
+        model = getattr(registry[p], 'module', registry[p])
+        path = onnx_path(args.model_path, p)
+        print(f"📤 Exportando {p} para {path}...")
+        export(model, path, args.opset)
+        print(f"  ✅ diferença máxima de probabilidade vs eager: {max_difference(model, path):.2e}")
@@ -0,0 +1,331 @@
+# coding=UTF-8
+import io
+import os
+import time
+import resource
+import torch
+import torch.nn as nn
+from torchvision import transforms as T
+from PIL import Image
+from Model_01 import Net, MultiHeadNet  # Net is needed to unpickle the full-module checkpoints
+
+perception = ['safety', 'lively', 'wealthy',
+              'beautiful', 'boring', 'depressing']
+model_dict = {
+    'safety': 'safety.pth',
+    'lively': 'lively.pth',
+    'wealthy': 'wealthy.pth',
+    'beautiful': 'beautiful.pth',
+    'boring': 'boring.pth',
+    'depressing': 'depressing.pth',
+}
+
+DEFAULT_BATCH_SIZE = 8
+MULTIHEAD_FILE = 'multihead.pth'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+INPUT_SIZE = (384, 384)
+
+train_transform = T.Compose([
+    T.Resize(INPUT_SIZE),
+    T.ToTensor(),
+    T.Normalize(
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225])
+])
+
+
+def _rss_bytes():
+    """
+    Current resident set size of this process in bytes.
+    Falls back to the peak RSS where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def list_local_images(images_path):
+    """
+    Sorted paths of every image under images_path (recursive)
+    """
+    paths = []
+    for root, _, files in os.walk(images_path):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def parse_counts(value):
+    """
+    Comma-separated command line list of counts, e.g. "1,2,4" -> [1, 2, 4]
+    """
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def read_local_image(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def load_image_tensor(img_data, draft=False):
+    """
+    Decode image data from memory and apply train_transform
+    img_data: bytes or PIL Image object
+    draft: let the JPEG decoder downscale by 1/2, 1/4 or 1/8 in the DCT
+           domain to the smallest size still >= INPUT_SIZE, instead of
+           decoding the full 2048 px thumbnail only to resize it away
+    Returns a (3, 384, 384) tensor
+    """
+    if isinstance(img_data, bytes):
+        img = Image.open(io.BytesIO(img_data))
+    else:
+        img = img_data
+
+    if draft and img.format == "JPEG":
+        img.draft("RGB", INPUT_SIZE)
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return train_transform(img)
+
+
+def load_image_tensor_draft(img_data):
+    """
+    load_image_tensor with JPEG draft decoding, picklable for process pools
+    """
+    return load_image_tensor(img_data, draft=True)
+
+
+def init_decode_worker():
+    """
+    Process pool initializer: decode workers run one intra-op thread each,
+    the pool size is what gives the parallelism
+    """
+    torch.set_num_threads(1)
+
+
+def predict(model, img_data, device):
+    """
+    Predict using model with image data from memory
+    img_data: bytes or PIL Image object
+    """
+    img = load_image_tensor(img_data)
+    img = img.view(1, 3, 384, 384)
+    # inference
+    if device == 'cuda:0':
+        pred = model(img.cuda())
+    else:
+        pred = model(img)
+    softmax = nn.Softmax(dim=1)
+    pred = softmax(pred)[0][1].item()
+    pred = round(pred*10, 2)
+
+    return pred
+
+
+def scores_from_logits(logits):
+    """
+    Softmax probability of the positive class, on the 0-10 scale used by predict
+    """
+    probs = torch.softmax(logits, dim=1)[:, 1]
+    return [round(prob*10, 2) for prob in probs.tolist()]
+
+
+def predict_batch(model, images, device, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Predict N images with one model, batch_size images per forward pass
+    images: list of bytes, PIL Image objects or tensors from load_image_tensor
+    Returns one score per image, with the same 0-10 rounding as predict
+    """
+    tensors = [img if torch.is_tensor(img) else load_image_tensor(img) for img in images]
+    scores = []
+    with torch.inference_mode():
+        for start in range(0, len(tensors), batch_size):
+            batch = torch.stack(tensors[start:start + batch_size]).to(device)
+            scores.extend(scores_from_logits(model(batch)))
+    return scores
+
+
+def predict_batch_multihead(model, images, device, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Predict N images with a MultiHeadNet, one backbone pass per batch
+    Returns {attribute: [score per image]}
+    """
+    tensors = [img if torch.is_tensor(img) else load_image_tensor(img) for img in images]
+    scores = {p: [] for p in getattr(model, 'module', model).attributes}
+    with torch.inference_mode():
+        for start in range(0, len(tensors), batch_size):
+            batch = torch.stack(tensors[start:start + batch_size]).to(device)
+            for p, logits in model(batch).items():
+                scores[p].extend(scores_from_logits(logits))
+    return scores
+
+
+def predict_batch_cached(model, model_key, images, hashes, cache, device, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    predict_batch / predict_batch_multihead with backbone embeddings taken
+    from an EmbeddingCache: only images missing from the cache go through
+    the ViT, the rest only through the heads
+    model_key: identifies the backbone weights, see backbone_fingerprint
+    hashes: content hash of each image, see content_hash
+    Returns scores like predict_batch (Net) or predict_batch_multihead (MultiHeadNet)
+    """
+    model = getattr(model, 'module', model)
+    keys = [f"{h}:{model_key}" for h in hashes]
+    with torch.inference_mode():
+        features = cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in features]
+        for start in range(0, len(missing), batch_size):
+            indexes = missing[start:start + batch_size]
+            batch = torch.stack([
+                images[i] if torch.is_tensor(images[i]) else load_image_tensor(images[i]) for i in indexes
+            ]).to(device)
+            computed = {keys[i]: f for i, f in zip(indexes, model.features(batch).float().cpu())}
+            cache.put_many(computed)
+            features.update(computed)
+        logits = model.classify(torch.stack([features[key] for key in keys]).to(device))
+    if isinstance(logits, dict):
+        return {p: scores_from_logits(p_logits) for p, p_logits in logits.items()}
+    return scores_from_logits(logits)
+
+
+def predict_all(registry, images, device, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Run every model in the registry over the same images
+    Images are decoded once and shared by all models
+    Returns {attribute: [score per image]}
+    """
+    tensors = [img if torch.is_tensor(img) else load_image_tensor(img) for img in images]
+    return {p: predict_batch(model, tensors, device, batch_size) for p, model in registry.items()}
+
+
+class ModelRegistry:
+    """
+    Loads every perception model in model_dict once and keeps it resident
+    in eval mode, so the inference loop only looks models up by attribute.
+    Per-model load time and resident memory are recorded in load_stats.
+    checkpoint_format: 'pth' (original pickled modules), 'safetensors'
+    (see checkpoints.py) or 'auto', safetensors where converted and verified
+    """
+
+    def __init__(self, model_load_path, device, attributes=None, checkpoint_format='auto'):
+        self.model_load_path = model_load_path
+        self.device = device
+        self.attributes = list(attributes or perception)
+        self.checkpoint_format = checkpoint_format
+        self.models = {}
+        self.load_stats = {}
+        self.backend = 'eager'
+
+    def _safetensors_file(self, p, manifest):
+        from checkpoints import safetensors_path, verify_checkpoint
+
+        path = safetensors_path(self.model_load_path, p)
+        entry = manifest.get(p)
+        if entry is not None and verify_checkpoint(path, entry):
+            return path
+        if self.checkpoint_format == 'safetensors':
+            raise RuntimeError(f"{path} ausente ou com checksum diferente do manifest, rode convert_checkpoints.py")
+        return None
+
+    def load(self):
+        manifest = {}
+        if self.checkpoint_format != 'pth':
+            from checkpoints import read_manifest, load_safetensors_model
+            manifest = read_manifest(self.model_load_path)
+
+        for p in self.attributes:
+            if p in self.models:
+                continue
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+
+            safetensors_file = self._safetensors_file(p, manifest) if self.checkpoint_format != 'pth' else None
+            if safetensors_file is not None:
+                model = load_safetensors_model(safetensors_file, self.device)
+            else:
+                model_path = os.path.join(self.model_load_path, model_dict[p])
+                model = torch.load(model_path, map_location=torch.device(self.device), weights_only=False)
+                if torch.cuda.device_count() > 1:
+                    model = nn.DataParallel(model)
+            model = model.to(self.device)
+            model.eval()
+
+            self.models[p] = model
+            self.load_stats[p] = {
+                'format': 'safetensors' if safetensors_file is not None else 'pth',
+                'load_seconds': time.perf_counter() - start,
+                'rss_delta_mb': (_rss_bytes() - rss_before) / 2**20,
+                'param_mb': sum(t.numel() * t.element_size() for t in model.parameters()) / 2**20,
+            }
+        return self
+
+    def apply_backend(self, name, threads=None):
+        """
+        Swap every resident model for its backend wrapper (see backends.py)
+        """
+        from backends import build_backend
+
+        for p in list(self.models):
+            self.models[p] = build_backend(name, self.models[p], self.model_load_path, p, threads)
+        self.backend = name
+        return self
+
+    def __getitem__(self, p):
+        return self.models[p]
+
+    def __contains__(self, p):
+        return p in self.models
+
+    def items(self):
+        return ((p, self.models[p]) for p in self.attributes if p in self.models)
+
+    def report(self):
+        """
+        Print load time and memory per model plus the process total,
+        which is what one worker needs to keep all models resident.
+        """
+        print("📦 Modelos carregados:")
+        for p in self.attributes:
+            stats = self.load_stats.get(p)
+            if stats is None:
+                continue
+            print(f"  {p:<11} {stats['format']:<11} {stats['load_seconds']:6.2f}s  "
+                  f"RSS +{stats['rss_delta_mb']:7.1f} MB  "
+                  f"parâmetros {stats['param_mb']:7.1f} MB")
+        total_seconds = sum(s['load_seconds'] for s in self.load_stats.values())
+        print(f"  total       {'':<11} {total_seconds:6.2f}s  RSS do processo {_rss_bytes() / 2**20:7.1f} MB")
+
+
+def save_multihead(model, path):
+    """
+    Save a MultiHeadNet as a plain state dict plus the attributes it scores
+    """
+    model = getattr(model, 'module', model)
+    num_class = next(iter(model.heads.values()))[-1].out_features
+    torch.save({
+        'attributes': model.attributes,
+        'num_class': num_class,
+        'state_dict': model.state_dict(),
+    }, path)
+
+
+def load_multihead(path, device):
+    """
+    Load a MultiHeadNet saved by save_multihead, ready for inference
+    """
+    checkpoint = torch.load(path, map_location=torch.device(device), weights_only=True)
+    model = MultiHeadNet(checkpoint['attributes'], num_class=checkpoint['num_class'], pretrained=False)
+    model.load_state_dict(checkpoint['state_dict'])
+    if torch.cuda.device_count() > 1:
+        model = nn.DataParallel(model)
+    model = model.to(device)
+    model.eval()
+    return model
@@ -0,0 +1,62 @@
+# coding=UTF-8
+"""
+One-time migration of the legacy processed/<object>.done marker objects
+into the public.processed_images manifest table.
+
+    python migrate_markers.py            # import the markers
+    python migrate_markers.py --delete   # import, then remove the marker objects
+"""
+import argparse
+from minio.deleteobjects import DeleteObject
+from eval import minio_client, BUCKET_NAME, ensure_tables, mark_images_as_processed
+
+MARKER_PREFIX = "processed/"
+MARKER_SUFFIX = ".done"
+CHUNK_SIZE = 1000
+
+
+def list_markers():
+    """
+    Returns [(marker object name, image object name)]
+    """
+    markers = []
+    for obj in minio_client.list_objects(BUCKET_NAME, prefix=MARKER_PREFIX, recursive=True):
+        if obj.object_name.endswith(MARKER_SUFFIX):
+            image_name = obj.object_name[len(MARKER_PREFIX):-len(MARKER_SUFFIX)]
+            markers.append((obj.object_name, image_name))
+    return markers
+
+
+def delete_markers(marker_names):
+    errors = minio_client.remove_objects(BUCKET_NAME, (DeleteObject(name) for name in marker_names))
+    failed = 0
+    for error in errors:
+        failed += 1
+        print(f"  ❌ Erro ao remover {error.name}: {error.message}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa os marcadores processed/*.done para o banco")
+    parser.add_argument("--delete", action="store_true",
+                        help="remove os marcadores do MinIO depois de importados")
+    args = parser.parse_args()
+
+    ensure_tables()
+    markers = list_markers()
+    print(f"🏷️ Encontrados {len(markers)} marcadores em {BUCKET_NAME}/{MARKER_PREFIX}")
+
+    imported = 0
+    for start in range(0, len(markers), CHUNK_SIZE):
+        chunk = markers[start:start + CHUNK_SIZE]
+        if not mark_images_as_processed([image_name for _, image_name in chunk]):
+            print("❌ Importação interrompida, nenhum marcador foi removido")
+            raise SystemExit(1)
+        imported += len(chunk)
+        print(f"  importados {imported}/{len(markers)}")
+
+    if args.delete and markers:
+        failed = delete_markers([marker for marker, _ in markers])
+        print(f"🗑️ Removidos {len(markers) - failed} marcadores")
+
+    print("✅ Migração concluída")
@@ -0,0 +1,247 @@
+# coding=UTF-8
+import time
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from inference import load_image_tensor, DEFAULT_BATCH_SIZE
+from embedding_cache import content_hash as sha256_hash
+from dedup import dhash
+
+_DONE = object()
+
+# tensor holds the undecoded bytes when the embedding cache already has the image
+DecodedImage = namedtuple('DecodedImage', ['tensor', 'content_hash', 'phash'])
+
+
+class ImageDecoder:
+    """
+    Pipeline decode step producing a DecodedImage: the model input tensor
+    plus, when asked for, the content hash used by the embedding cache and
+    the perceptual hash used by deduplication. Picklable, so it also works
+    in a decode process pool.
+
+    cached: a CachedEmbeddings; images it already holds are not decoded, the
+    raw bytes are passed on instead (predict_batch_cached only decodes them
+    if the entry was evicted in the meantime)
+    """
+
+    def __init__(self, decode=load_image_tensor, content_hash=False, perceptual_hash=False, cached=None):
+        self.decode = decode
+        self.content_hash = content_hash or cached is not None
+        self.perceptual_hash = perceptual_hash
+        self.cached = cached
+
+    def __call__(self, img_data):
+        digest = sha256_hash(img_data) if self.content_hash else None
+        if self.cached is not None and digest in self.cached:
+            tensor = img_data
+        else:
+            tensor = self.decode(img_data)
+        return DecodedImage(
+            tensor,
+            digest,
+            dhash(img_data) if self.perceptual_hash else None,
+        )
+
+
+class StageTimer:
+    """
+    Thread-safe per-stage counters. Each stage accumulates busy seconds and
+    item counts; *_starved stages record time spent waiting for input and
+    *_blocked stages time spent waiting for room downstream, which together
+    show which stage is the bottleneck. first_done holds the
+    time.perf_counter() at which each stage first completed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.items = {}
+        self.first_done = {}
+
+    def add(self, stage, seconds, items=1):
+        with self._lock:
+            self.first_done.setdefault(stage, time.perf_counter())
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.items[stage] = self.items.get(stage, 0) + items
+
+    @contextmanager
+    def measure(self, stage, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def report(self, wall_seconds=None):
+        print("⏱️ Tempo por estágio:")
+        for stage in sorted(self.seconds):
+            seconds = self.seconds[stage]
+            items = self.items[stage]
+            if items:
+                print(f"  {stage:<18} {seconds:9.2f}s  {items:7d} itens  {1000 * seconds / items:8.1f} ms/item")
+            else:
+                print(f"  {stage:<18} {seconds:9.2f}s")
+        if wall_seconds is not None:
+            print(f"  {'wall':<18} {wall_seconds:9.2f}s")
+
+
+class PrefetchPipeline:
+    """
+    Producer/consumer pipeline overlapping object downloads, decoding and
+    inference:
+
+        names -> download threads -> raw queue -> decode threads -> ready queue -> batches
+
+    Both queues are bounded by queue_depth, so at most about
+    2 * queue_depth images are held in memory whatever the input size.
+    Iterating yields (names, tensors) batches of up to batch_size images;
+    images that fail to download or decode are recorded in self.failed and
+    skipped.
+
+    With decode_executor (e.g. a ProcessPoolExecutor) each decode thread
+    hands its image to the executor, so decode_workers bounds the number of
+    images being decoded at once and decode must be picklable.
+    """
+
+    def __init__(self, names, fetch, decode=load_image_tensor, batch_size=DEFAULT_BATCH_SIZE,
+                 download_workers=4, decode_workers=1, queue_depth=32, timer=None,
+                 decode_executor=None):
+        self.names = list(names)
+        self.fetch = fetch
+        self.decode = decode
+        self.decode_executor = decode_executor
+        self.batch_size = batch_size
+        self.download_workers = download_workers
+        self.decode_workers = decode_workers
+        self.timer = timer or StageTimer()
+        self.failed = []
+
+        self._names_lock = threading.Lock()
+        self._next_name = 0
+        self._raw = queue.Queue(maxsize=queue_depth)
+        self._ready = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._threads = []
+        self._decoders_left = decode_workers
+        self._decoders_lock = threading.Lock()
+
+    def _take_name(self):
+        with self._names_lock:
+            if self._next_name >= len(self.names):
+                return None
+            name = self.names[self._next_name]
+            self._next_name += 1
+            return name
+
+    def _put(self, q, item, wait_stage):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.timer.add(wait_stage, time.perf_counter() - start, 0)
+
+    def _get(self, q, wait_stage):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _DONE
+        self.timer.add(wait_stage, time.perf_counter() - start, 0)
+        return item
+
+    def _download_loop(self):
+        while not self._stop.is_set():
+            name = self._take_name()
+            if name is None:
+                break
+            with self.timer.measure('download'):
+                try:
+                    data = self.fetch(name)
+                except Exception as e:
+                    data = None
+                    print(f"Erro ao baixar imagem {name}: {e}")
+            if data is None:
+                self.failed.append((name, 'download'))
+                continue
+            self._put(self._raw, (name, data), 'download_blocked')
+
+    def _decode_loop(self):
+        while True:
+            item = self._get(self._raw, 'decode_starved')
+            if item is _DONE:
+                break
+            name, data = item
+            with self.timer.measure('decode'):
+                try:
+                    if self.decode_executor is not None:
+                        tensor = self.decode_executor.submit(self.decode, data).result()
+                    else:
+                        tensor = self.decode(data)
+                except Exception as e:
+                    tensor = None
+                    print(f"⚠️ Erro ao decodificar {name}: {e}, pulando...")
+            if tensor is None:
+                self.failed.append((name, 'decode'))
+                continue
+            self._put(self._ready, (name, tensor), 'decode_blocked')
+
+        with self._decoders_lock:
+            self._decoders_left -= 1
+            last = self._decoders_left == 0
+        if last:
+            self._put(self._ready, _DONE, 'decode_blocked')
+
+    def _close_downloads(self, downloaders):
+        for thread in downloaders:
+            thread.join()
+        # one end marker per decoder, once every download has been queued
+        for _ in range(self.decode_workers):
+            self._put(self._raw, _DONE, 'download_blocked')
+
+    def start(self):
+        downloaders = [threading.Thread(target=self._download_loop, daemon=True)
+                       for _ in range(self.download_workers)]
+        decoders = [threading.Thread(target=self._decode_loop, daemon=True)
+                    for _ in range(self.decode_workers)]
+        closer = threading.Thread(target=self._close_downloads, args=(downloaders,), daemon=True)
+        self._threads = downloaders + decoders + [closer]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop every stage, e.g. when the consumer bails out early
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def __iter__(self):
+        if not self._threads:
+            self.start()
+        try:
+            batch_names, batch_tensors = [], []
+            while True:
+                item = self._get(self._ready, 'inference_starved')
+                if item is _DONE:
+                    break
+                name, tensor = item
+                batch_names.append(name)
+                batch_tensors.append(tensor)
+                if len(batch_names) == self.batch_size:
+                    yield batch_names, batch_tensors
+                    batch_names, batch_tensors = [], []
+            if batch_names:
+                yield batch_names, batch_tensors
+        finally:
+            self.close()
@@ -0,0 +1,173 @@
+# coding=UTF-8
+"""
+Multi-process inference on one host with a single copy of the weights.
+
+The six models are loaded once in the parent and moved to shared memory
+(share_memory()); worker processes are forked from it and run the models
+on their own chunk of each batch with a fixed number of intra-op threads.
+Each extra process only costs its activations, not another ~2 GB of weights.
+
+Sweep of images/sec over process count x threads per process:
+
+    python replicas.py --images ./test_image --processes 1,2,4 --threads 1,2,4
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from inference import (ModelRegistry, DEFAULT_BATCH_SIZE, list_local_images,
+                       read_local_image, load_image_tensor, predict_all, parse_counts, _rss_bytes)
+
+_registry = None
+_batch_size = DEFAULT_BATCH_SIZE
+
+
+def _pss_bytes():
+    """
+    Proportional set size of this process: shared pages are divided among
+    the processes mapping them, so the sum over all replicas is the real
+    memory cost. None where /proc/self/smaps_rollup is not available.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _init_replica(registry, threads, batch_size):
+    global _registry, _batch_size
+    # forked: registry is the parent's object, its tensors are the shared ones
+    _registry = registry
+    _batch_size = batch_size
+    torch.set_num_threads(threads)
+
+
+def _predict_chunk(batch):
+    scores = predict_all(_registry, list(batch), 'cpu', _batch_size)
+    return scores, os.getpid(), _pss_bytes()
+
+
+class ReplicaPool:
+    """
+    Pool of forked inference processes sharing the weights of a CPU
+    ModelRegistry. predict() splits the images in chunks of at most
+    batch_size, spread over the processes, and returns the scores in order.
+    threads defaults to the cores divided by the processes.
+    """
+
+    def __init__(self, registry, processes, threads=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.registry = registry
+        self.processes = processes
+        self.threads = threads or max(1, (os.cpu_count() or 1) // processes)
+        self.batch_size = batch_size
+        self.pss = {}
+        for _, model in registry.items():
+            model.share_memory()
+        # fork, not spawn: children inherit the registry without pickling it
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context('fork'),
+                                            initializer=_init_replica,
+                                            initargs=(registry, self.threads, batch_size))
+
+    def start(self):
+        """
+        Fork every process now, e.g. before starting any other thread
+        """
+        for future in [self.executor.submit(os.getpid) for _ in range(self.processes)]:
+            future.result()
+        return self
+
+    def predict(self, tensors):
+        """
+        Returns {attribute: [score per image]} like predict_all
+        """
+        tensors = [t if torch.is_tensor(t) else load_image_tensor(t) for t in tensors]
+        chunk_size = min(self.batch_size, math.ceil(len(tensors) / self.processes)) or 1
+        # stacked tensors travel through shared memory, not through the pipe
+        chunks = [torch.stack(tensors[start:start + chunk_size])
+                  for start in range(0, len(tensors), chunk_size)]
+        results = {p: [] for p, _ in self.registry.items()}
+        for scores, pid, pss in self.executor.map(_predict_chunk, chunks):
+            for p, chunk_scores in scores.items():
+                results[p].extend(chunk_scores)
+            if pss is not None:
+                self.pss[pid] = pss
+        return results
+
+    def memory_mb(self):
+        """
+        Parent RSS and summed worker PSS, in MB
+        """
+        return {'parent_rss_mb': _rss_bytes() / 2**20,
+                'workers_pss_mb': sum(self.pss.values()) / 2**20 if self.pss else None}
+
+    def report(self):
+        memory = self.memory_mb()
+        workers = (f", PSS dos processos {memory['workers_pss_mb']:.1f} MB"
+                   if memory['workers_pss_mb'] is not None else "")
+        print(f"🧵 {self.processes} processos x {self.threads} threads, "
+              f"RSS do processo principal {memory['parent_rss_mb']:.1f} MB{workers}")
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Images/s de réplicas multiprocesso por processos x threads")
+    parser.add_argument("--images", required=True, help="diretório com as imagens de teste")
+    parser.add_argument("--model-path", default="./model")
+    parser.add_argument("--processes", default="1,2,4", help="números de processos, separados por vírgula")
+    parser.add_argument("--threads", default="1,2,4", help="threads por processo, separadas por vírgula")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--json", default=None, help="arquivo para salvar os resultados")
+    args = parser.parse_args()
+
+    paths = list_local_images(args.images)
+    if not paths:
+        print(f"❌ Nenhuma imagem encontrada em {args.images}")
+        sys.exit(1)
+    tensors = [load_image_tensor(read_local_image(path)) for path in paths]
+
+    registry = ModelRegistry(args.model_path, 'cpu').load()
+    registry.report()
+
+    results = []
+    for processes in parse_counts(args.processes):
+        for threads in parse_counts(args.threads):
+            with ReplicaPool(registry, processes, threads, args.batch_size) as pool:
+                # warm-up: one chunk per process, not timed
+                pool.predict(tensors[:processes])
+                start = time.perf_counter()
+                pool.predict(tensors)
+                seconds = time.perf_counter() - start
+                memory = pool.memory_mb()
+            results.append({'processes': processes, 'threads': threads, 'cores': processes * threads,
+                            'images_per_second': len(tensors) / seconds, **memory})
+            print(f"  {processes} x {threads}: {len(tensors) / seconds:.2f} img/s")
+
+    print(f"📸 {len(tensors)} imagens, batch {args.batch_size}, {os.cpu_count()} CPUs")
+    print(f"  {'proc':>4} {'threads':>7} {'cores':>5} {'img/s':>8} {'PSS total MB':>13}")
+    for result in results:
+        pss = f"{result['workers_pss_mb']:13.1f}" if result['workers_pss_mb'] is not None else f"{'-':>13}"
+        print(f"  {result['processes']:>4} {result['threads']:>7} {result['cores']:>5} "
+              f"{result['images_per_second']:8.2f} {pss}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'images': len(tensors), 'batch_size': args.batch_size,
+                       'cpus': os.cpu_count(), 'results': results}, f, indent=2)
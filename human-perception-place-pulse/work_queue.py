@@ -0,0 +1,139 @@
+# coding=UTF-8
+import os
+import socket
+import threading
+from datetime import timedelta
+from sqlalchemy import select, update, func, or_, and_, case
+from sqlalchemy.dialects.postgresql import insert
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Work queue of image object names in a PostgreSQL table, shared by any
+    number of eval.py workers. Workers claim batches with
+    SELECT ... FOR UPDATE SKIP LOCKED, so two workers never get the same
+    image, and each claim holds a lease: items of a worker that crashed are
+    claimed again once their lease expires. Items are retried up to
+    max_attempts times and then left as failed.
+    """
+
+    def __init__(self, engine, queue_table, max_attempts=3):
+        self.engine = engine
+        self.table = queue_table
+        self.max_attempts = max_attempts
+
+    def enqueue(self, object_names, chunk_size=1000):
+        """
+        Add images to the queue; names already queued (in any state) are kept as is
+        """
+        object_names = list(object_names)
+        with self.engine.begin() as conn:
+            for start in range(0, len(object_names), chunk_size):
+                rows = [{'img_path': name, 'status': PENDING, 'attempts': 0}
+                        for name in object_names[start:start + chunk_size]]
+                conn.execute(insert(self.table).values(rows).on_conflict_do_nothing(index_elements=['img_path']))
+        return len(object_names)
+
+    def claim(self, worker_id, n, lease_seconds):
+        """
+        Claim up to n pending (or lease-expired) images for worker_id
+        Returns the claimed object names
+        """
+        t = self.table
+        with self.engine.begin() as conn:
+            # expired leases that already used every attempt are given up on
+            conn.execute(update(t)
+                         .where(t.c.status == CLAIMED, t.c.lease_expires_at < func.now(),
+                                t.c.attempts >= self.max_attempts)
+                         .values(status=FAILED, lease_owner=None, updated_at=func.now()))
+
+            candidates = (select(t.c.img_path)
+                          .where(or_(t.c.status == PENDING,
+                                     and_(t.c.status == CLAIMED, t.c.lease_expires_at < func.now())))
+                          .where(t.c.attempts < self.max_attempts)
+                          .order_by(t.c.attempts, t.c.img_path)
+                          .limit(n)
+                          .with_for_update(skip_locked=True))
+            result = conn.execute(update(t)
+                                  .where(t.c.img_path.in_(candidates))
+                                  .values(status=CLAIMED,
+                                          lease_owner=worker_id,
+                                          lease_expires_at=func.now() + timedelta(seconds=lease_seconds),
+                                          attempts=t.c.attempts + 1,
+                                          updated_at=func.now())
+                                  .returning(t.c.img_path))
+            return sorted(row[0] for row in result)
+
+    def complete(self, conn, object_names):
+        """
+        Mark images as done; takes the connection of the transaction that
+        wrote their classification (ClassificationWriter after_write)
+        """
+        t = self.table
+        conn.execute(update(t)
+                     .where(t.c.img_path.in_(list(object_names)))
+                     .values(status=DONE, lease_owner=None, lease_expires_at=None, updated_at=func.now()))
+
+    def release(self, worker_id, object_names):
+        """
+        Give back images this worker claimed but did not complete, e.g.
+        failed downloads; they are retried until max_attempts
+        """
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(update(t)
+                         .where(t.c.img_path.in_(list(object_names)),
+                                t.c.status == CLAIMED, t.c.lease_owner == worker_id)
+                         .values(status=case((t.c.attempts >= self.max_attempts, FAILED), else_=PENDING),
+                                 lease_owner=None, lease_expires_at=None, updated_at=func.now()))
+
+    def extend_leases(self, worker_id, lease_seconds):
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(update(t)
+                         .where(t.c.status == CLAIMED, t.c.lease_owner == worker_id)
+                         .values(lease_expires_at=func.now() + timedelta(seconds=lease_seconds)))
+
+    def counts(self):
+        t = self.table
+        with self.engine.connect() as conn:
+            return dict(conn.execute(select(t.c.status, func.count()).group_by(t.c.status)).all())
+
+
+class LeaseHeartbeat:
+    """
+    Background thread renewing the leases of a worker every lease_seconds / 3,
+    so long batches are not reclaimed while the worker is still alive
+    """
+
+    def __init__(self, work_queue, worker_id, lease_seconds):
+        self.work_queue = work_queue
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.work_queue.extend_leases(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ Erro ao renovar leases: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
@@ -0,0 +1,193 @@
+# coding=UTF-8
+import os
+import csv
+import time
+import pandas as pd
+from sqlalchemy.dialects.postgresql import insert
+
+
+class ClassificationWriter:
+    """
+    Buffers classification rows and writes each batch with one multi-row
+    INSERT ... ON CONFLICT DO UPDATE. The images of the batch are recorded
+    in the processed manifest inside the same transaction, so the manifest
+    only advances once their scores are committed.
+
+    A batch is flushed when batch_size rows are buffered, when maybe_flush()
+    is called more than flush_seconds after the oldest buffered row, and on
+    close() -- which leaving a with block always does, also on errors.
+    Rows of a batch that fails to commit are dropped from the buffer; they
+    are not in the manifest, so the next run picks them up again.
+
+    after_write(conn, object_names), if given, runs inside the same
+    transaction, e.g. to complete the items in the work queue.
+    """
+
+    def __init__(self, engine, classification_table, processed_table,
+                 batch_size=64, flush_seconds=10.0, timer=None, phash_table=None,
+                 after_write=None):
+        self.engine = engine
+        self.after_write = after_write
+        self.classification_table = classification_table
+        self.processed_table = processed_table
+        self.phash_table = phash_table
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.timer = timer
+        self.saved = 0
+        self.failed = 0
+        # keyed by img_path: one upsert cannot touch the same row twice
+        self._rows = {}
+        self._object_names = []
+        self._phashes = {}
+        self._oldest = None
+
+    def add(self, object_name, image_scores, phash=None):
+        """
+        Buffer one row; phash (signed 64-bit) is stored in phash_table
+        """
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._rows[image_scores['img_path']] = dict(image_scores)
+        self._object_names.append(object_name)
+        if phash is not None and self.phash_table is not None:
+            self._phashes[image_scores['img_path']] = phash
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def maybe_flush(self):
+        if self._oldest is not None and time.monotonic() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    def _upsert(self, conn, rows):
+        stmt = insert(self.classification_table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['img_path'],
+            set_={c.name: stmt.excluded[c.name] for c in self.classification_table.columns
+                  if c.name != 'img_path'}
+        )
+        conn.execute(stmt)
+
+    def _mark_processed(self, conn, object_names):
+        processed_at = pd.Timestamp.now().to_pydatetime()
+        rows = [{'img_path': name, 'processed_at': processed_at} for name in dict.fromkeys(object_names)]
+        conn.execute(insert(self.processed_table).values(rows)
+                     .on_conflict_do_nothing(index_elements=['img_path']))
+
+    def _save_phashes(self, conn, phashes):
+        stmt = insert(self.phash_table).values(
+            [{'img_path': img_path, 'phash': phash} for img_path, phash in phashes.items()])
+        conn.execute(stmt.on_conflict_do_update(index_elements=['img_path'],
+                                                set_={'phash': stmt.excluded.phash}))
+
+    def flush(self):
+        """
+        Write the buffered rows in one transaction, returns how many were saved
+        """
+        if not self._rows:
+            return 0
+        rows = list(self._rows.values())
+        object_names = self._object_names
+        phashes = self._phashes
+        self._rows, self._object_names, self._phashes, self._oldest = {}, [], {}, None
+
+        start = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                self._upsert(conn, rows)
+                self._mark_processed(conn, object_names)
+                if phashes:
+                    self._save_phashes(conn, phashes)
+                if self.after_write is not None:
+                    self.after_write(conn, object_names)
+        except Exception as e:
+            self.failed += len(rows)
+            print(f"  ❌ Erro ao salvar lote de {len(rows)} classificações no banco: {e}")
+            return 0
+        finally:
+            if self.timer is not None:
+                self.timer.add('db_write', time.perf_counter() - start, len(rows))
+
+        self.saved += len(rows)
+        print(f"  💾 {len(rows)} classificações salvas no banco ({self.saved} no total)")
+        return len(rows)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class BackupWriter:
+    """
+    Append-only CSV backup of every classified image, one file per run in
+    out_path. Rows are written in groups of flush_rows and flushed to disk,
+    so memory stays constant and a crashed run leaves every completed group
+    readable by read_backup().
+    """
+
+    def __init__(self, out_path, columns, flush_rows=256):
+        if not os.path.exists(out_path):
+            os.makedirs(out_path)
+        self.columns = list(columns)
+        self.flush_rows = flush_rows
+        self.path = os.path.join(out_path, f"classification_{pd.Timestamp.now():%Y%m%d_%H%M%S}.csv")
+        self.rows_written = 0
+        self._buffer = []
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        self._csv.writeheader()
+        self._file.flush()
+
+    def add(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self._csv.writerows(self._buffer)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def read_backup(path, score_columns):
+    """
+    Stream the rows of a BackupWriter CSV, with scores parsed as floats
+    (None when empty). A last line cut short by a crash is skipped.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(_complete_lines(f))
+        for row in reader:
+            for column in score_columns:
+                value = row.get(column)
+                row[column] = float(value) if value not in (None, '') else None
+            yield row
+
+
+def _complete_lines(f):
+    for line in f:
+        if not line.endswith('\n'):
+            break
+        yield line
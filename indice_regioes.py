@@ -0,0 +1,63 @@
+import numpy as np
+import shapely
+import geopandas as gpd
+from shapely.strtree import STRtree
+
+CAMINHO_REGIOES = 'coordenadas_poligonais/regioes_df.geojson'
+
+
+class IndiceRegioes:
+    """
+    Índice local das regiões administrativas para ponto-em-polígono sem rede:
+    STRtree sobre os polígonos do GeoJSON, com as geometrias preparadas
+    (shapely.prepare), consultado para um array inteiro de pontos de uma vez.
+    Regiões sem geometria no arquivo ficam de fora.
+    """
+
+    def __init__(self, caminho_geojson=CAMINHO_REGIOES, coluna='name'):
+        gdf = gpd.read_file(caminho_geojson)
+        gdf = gdf[gdf['geometry'].notnull() & gdf['geometry'].is_valid]
+        if gdf.crs is not None and not gdf.crs.equals("EPSG:4326"):
+            gdf = gdf.to_crs("EPSG:4326")
+        self.nomes = gdf[coluna].to_numpy(dtype=object)
+        self.geometrias = gdf['geometry'].to_numpy()
+        shapely.prepare(self.geometrias)
+        self.tree = STRtree(self.geometrias)
+
+    def consultar(self, lats, lons):
+        """
+        Região de cada ponto numa única consulta vetorizada.
+
+        Args:
+            lats, lons: Arrays (ou listas) de mesmo tamanho
+
+        Returns:
+            np.ndarray: Nome da região de cada ponto (dtype object), None fora de todas
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        pontos = shapely.points(lons, lats)
+        idx_pontos, idx_regioes = self.tree.query(pontos, predicate='within')
+        resultado = np.full(len(pontos), None, dtype=object)
+        # com polígonos sobrepostos fica a primeira região do arquivo
+        ordem = np.lexsort((idx_regioes, idx_pontos))
+        idx_pontos, idx_regioes = idx_pontos[ordem], idx_regioes[ordem]
+        primeiros = np.unique(idx_pontos, return_index=True)[1]
+        resultado[idx_pontos[primeiros]] = self.nomes[idx_regioes[primeiros]]
+        return resultado
+
+    def regiao(self, lat, lon):
+        return self.consultar([lat], [lon])[0]
+
+
+_indices = {}
+
+
+def get_indice(caminho_geojson=CAMINHO_REGIOES, coluna='name'):
+    """
+    Índice carregado uma vez por processo para cada arquivo/coluna
+    """
+    chave = (caminho_geojson, coluna)
+    if chave not in _indices:
+        _indices[chave] = IndiceRegioes(caminho_geojson, coluna)
+    return _indices[chave]
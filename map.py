@@ -1,19 +1,24 @@
 import os
-import uuid
-import time
-import requests
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
-from overpass import get_coordenadas
-from storage import upload_imagem
-from database import criar_tabela, salvar_registro
+from overpass import get_coordenadas, get_coordenadas_array
+from overpass_cache import configurar_cache
+from storage import upload_resposta
+from database import (criar_tabela, GravadorRegistros, place_id_do_mapillary, place_ids_existentes,
+                      coordenadas_existentes)
+from amostragem import (TAMANHO_CELULA_METROS, CAMINHO_REGIOES, COLUNA_REGIAO, carregar_regioes,
+                        celulas_ocupadas, amostrar_coordenadas, resumo_por_regiao)
+from checkpoint import Checkpoint
+from mapillary_client import MapillaryClient
+from mapillary_cache import (CacheImagens, TAMANHO_TILE, RAIO_METROS, descobrir_tile,
+                             tiles_das_coordenadas, bbox_do_tile)
 
 load_dotenv()
 access_token = os.getenv("MAPILLARY_ACCESS_TOKEN")
 
-criar_tabela()
-coordenadas = get_coordenadas()
-
 def inferir_regiao(lat, lon):
     if lat < -15.78 and lon < -47.9:
         return "Ceilândia"
@@ -24,37 +29,214 @@ def inferir_regiao(lat, lon):
     else:
         return "Taguatinga"
 
-for i, (lat, lon) in enumerate(coordenadas[:20]):
-    bbox = f"{lon - 0.001},{lat - 0.001},{lon + 0.001},{lat + 0.001}"
-    url = "https://graph.mapillary.com/images"
-    params = {
-        "fields": "id,thumb_2048_url",
-        "bbox": bbox,
-        "limit": 1,
-        "access_token": access_token
-    }
+class Contadores:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valores = {"salvas": 0, "ja_existentes": 0, "sem_imagem": 0, "erros": 0}
+
+    def incrementar(self, nome):
+        with self.lock:
+            self.valores[nome] += 1
+
+def abrir_thumb(cliente, img):
+    """
+    Abre o thumbnail de uma imagem; URLs vindas do cache podem ter expirado,
+    então em caso de erro a URL é renovada pela API e a tentativa repetida.
+    """
+    if img.get("thumb_2048_url"):
+        try:
+            return cliente.abrir_imagem(img["thumb_2048_url"])
+        except Exception:
+            pass
+    return cliente.abrir_imagem(cliente.buscar_thumb(img["id"]))
 
+def processar_coordenada(cliente, lat, lon, contadores, gravador, img=None, checkpoint=None):
+    """
+    Salva a imagem de uma coordenada no MinIO e entrega o registro ao
+    gravador em lote; sem `img` (descoberta já feita) a imagem é buscada
+    na API com uma bbox em volta do ponto.
+    """
     try:
-        r = requests.get(url, params=params)
-        data = r.json()
-        if data.get("data"):
-            img = data["data"][0]
-            img_url = img["thumb_2048_url"]
-            img_data = requests.get(img_url).content
-
-            place_id = uuid.uuid4()
-            image_name = f"{place_id}.jpg"
-            temp_path = f"/tmp/{image_name}"
-
-            with open(temp_path, "wb") as f:
-                f.write(img_data)
-
-            upload_imagem(temp_path, image_name)
-            salvar_registro(place_id, inferir_regiao(lat, lon), lat, lon)
-
-            print(f"✅ {image_name} salva no MinIO e registrada no banco.")
-            time.sleep(1)
-        else:
-            print(f"⚠️ Nenhuma imagem para {lat}, {lon}")
+        if img is None:
+            img = cliente.buscar_imagem(lat, lon)
+            if img is None:
+                contadores.incrementar("sem_imagem")
+                print(f"⚠️ Nenhuma imagem para {lat}, {lon}")
+                return
+            # na busca por bbox o id só é conhecido agora
+            if (checkpoint is not None and img["id"] in checkpoint) or \
+                    place_ids_existentes([place_id_do_mapillary(img["id"])]):
+                contadores.incrementar("ja_existentes")
+                return
+
+        # mesmo id do Mapillary -> mesmo place_id e mesmo objeto no MinIO
+        place_id = place_id_do_mapillary(img["id"])
+        image_name = f"{place_id}.jpg"
+
+        # O thumbnail vai do CDN para o MinIO sem arquivo temporário
+        with abrir_thumb(cliente, img) as resposta:
+            upload_resposta(resposta, image_name)
+        # o checkpoint é atualizado quando o lote do registro for gravado
+        gravador.adicionar(place_id, inferir_regiao(lat, lon), lat, lon, mapillary_id=img["id"])
+
+        contadores.incrementar("salvas")
+        print(f"✅ {image_name} salva no MinIO.")
     except Exception as e:
+        contadores.incrementar("erros")
         print(f"❌ Erro em {lat}, {lon}: {e}")
+
+def descobrir_imagens(cliente, cache, coordenadas, concorrencia, tamanho_tile=TAMANHO_TILE,
+                      raio_metros=RAIO_METROS):
+    """
+    Descoberta em lote: baixa os metadados de todas as imagens dos tiles que
+    cobrem as coordenadas (só os que não estão no cache) e escolhe a melhor
+    imagem de cada ponto localmente.
+
+    Returns:
+        tuple: (lista de (lat, lon, imagem) sem imagens repetidas, pontos sem imagem)
+    """
+    tiles = tiles_das_coordenadas(coordenadas, tamanho_tile, raio_metros)
+    pendentes = [t for t in tiles if not cache.tile_valido(f"{t[0]}:{t[1]}:{tamanho_tile}")]
+    print(f"🗺️ {len(tiles)} tiles, {len(tiles) - len(pendentes)} já no cache")
+    chamadas, falhas = 0, 0
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        futuros = {executor.submit(descobrir_tile, cliente, cache, bbox_do_tile(t, tamanho_tile),
+                                   f"{t[0]}:{t[1]}:{tamanho_tile}"): t for t in pendentes}
+        for futuro in as_completed(futuros):
+            try:
+                chamadas += futuro.result()
+            except Exception as e:
+                # o tile não é marcado como buscado e volta na próxima execução
+                falhas += 1
+                print(f"❌ Erro na descoberta do tile {futuros[futuro]}: {e}")
+    print(f"🗺️ {chamadas} chamadas de descoberta, {cache.total_imagens()} imagens no cache")
+    if falhas:
+        print(f"⚠️ {falhas} tiles falharam na descoberta; os pontos deles ficam sem imagem nesta execução")
+
+    escolhidas, vistas, sem_imagem = [], set(), 0
+    for lat, lon in coordenadas:
+        img = cache.melhor_imagem(lat, lon, raio_metros)
+        if img is None:
+            sem_imagem += 1
+        elif img["id"] not in vistas:
+            # pontos vizinhos podem escolher a mesma imagem
+            vistas.add(img["id"])
+            escolhidas.append((lat, lon, img))
+    return escolhidas, sem_imagem
+
+def filtrar_existentes(tarefas, checkpoint=None):
+    """
+    Remove, antes de qualquer download, as imagens já registradas no
+    checkpoint ou em urban_images (uma consulta por 1000 ids).
+    """
+    if checkpoint is not None:
+        tarefas = [t for t in tarefas if t[2]["id"] not in checkpoint]
+    existentes = place_ids_existentes(place_id_do_mapillary(img["id"]) for _, _, img in tarefas)
+    return [t for t in tarefas if place_id_do_mapillary(t[2]["id"]) not in existentes]
+
+def registrar_no_checkpoint(checkpoint):
+    def registrar(registros):
+        # um fsync por lote gravado no banco
+        checkpoint.registrar_varios([{"mapillary_id": registro["mapillary_id"], "place_id": registro["place_id"],
+                                      "lat": registro["latitude"], "lon": registro["longitude"]}
+                                     for registro in registros])
+    return registrar
+
+def ingerir(coordenadas, concorrencia=16, requisicoes_por_segundo=100, cache=None,
+            tamanho_tile=TAMANHO_TILE, raio_metros=RAIO_METROS, checkpoint=None,
+            tamanho_lote=500, intervalo_segundos=5.0):
+    """
+    Busca e salva uma imagem por coordenada com `concorrencia` threads
+    compartilhando uma sessão HTTP e o limite de requisições da API.
+    Com `cache` (CacheImagens) a descoberta é feita por tiles, senão
+    com uma chamada por coordenada. Imagens já ingeridas (checkpoint ou
+    urban_images) não são baixadas de novo. Os registros são gravados em
+    lotes de `tamanho_lote` ou a cada `intervalo_segundos`.
+    """
+    cliente = MapillaryClient(access_token, requisicoes_por_segundo, concorrencia)
+    contadores = Contadores()
+    if cache is not None:
+        tarefas, contadores.valores["sem_imagem"] = descobrir_imagens(
+            cliente, cache, coordenadas, concorrencia, tamanho_tile, raio_metros)
+        novas = filtrar_existentes(tarefas, checkpoint)
+        contadores.valores["ja_existentes"] = len(tarefas) - len(novas)
+        print(f"🆕 {len(novas)} imagens novas, {len(tarefas) - len(novas)} já ingeridas")
+        tarefas = novas
+    else:
+        tarefas = [(lat, lon, None) for lat, lon in coordenadas]
+    apos_gravar = registrar_no_checkpoint(checkpoint) if checkpoint is not None else None
+    with GravadorRegistros(tamanho_lote, intervalo_segundos, apos_gravar) as gravador:
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            for lat, lon, img in tarefas:
+                executor.submit(processar_coordenada, cliente, lat, lon, contadores, gravador, img, checkpoint)
+    if gravador.falhas:
+        print(f"⚠️ {gravador.falhas} registros não gravados no banco (serão refeitos na próxima execução)")
+
+    print(f"📊 {contadores.valores['salvas']} salvas, {contadores.valores['ja_existentes']} já existentes, "
+          f"{contadores.valores['sem_imagem']} sem imagem, "
+          f"{contadores.valores['erros']} erros, {cliente.retentativas} novas tentativas na API")
+    return contadores.valores
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coleta imagens do Mapillary para coordenadas do Overpass")
+    parser.add_argument("--amostragem", choices=["grade", "aleatoria"], default="grade",
+                        help="grade: pontos distribuídos numa grade sobre as RAs; aleatoria: sorteio simples")
+    parser.add_argument("--limite", type=int, default=20,
+                        help="amostragem aleatoria: número de coordenadas sorteadas (0 = todas)")
+    parser.add_argument("--celula", type=float, default=TAMANHO_CELULA_METROS,
+                        help="amostragem grade: lado da célula em metros")
+    parser.add_argument("--por-celula", type=int, default=1, help="amostragem grade: pontos por célula")
+    parser.add_argument("--por-regiao", type=int, default=None,
+                        help="amostragem grade: máximo de pontos por região administrativa")
+    parser.add_argument("--preencher-vazias", action="store_true",
+                        help="amostragem grade: usa o centro das células sem pontos de interesse")
+    parser.add_argument("--regioes", default=CAMINHO_REGIOES,
+                        help="amostragem grade: GeoJSON com os polígonos das regiões administrativas")
+    parser.add_argument("--coluna-regiao", default=COLUNA_REGIAO,
+                        help="amostragem grade: coluna com o nome da região (ex. name para regioes_df.geojson)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--overpass-ttl-horas", type=float, default=None,
+                        help="validade das respostas do Overpass no cache em disco (padrão 168)")
+    parser.add_argument("--overpass-offline", action="store_true",
+                        help="usa só respostas do Overpass já em cache, sem acessar a rede")
+    parser.add_argument("--concorrencia", type=int, default=16, help="requisições simultâneas")
+    parser.add_argument("--rps", type=float, default=100,
+                        help="requisições por segundo à Graph API (a cota de busca é 10.000 por minuto)")
+    parser.add_argument("--descoberta", choices=["tiles", "bbox"], default="tiles",
+                        help="tiles: metadados em lote por tile, com cache local; bbox: uma chamada por coordenada")
+    parser.add_argument("--cache", default="mapillary_cache.sqlite", help="cache local dos metadados")
+    parser.add_argument("--cache-dias", type=float, default=30, help="validade de um tile no cache")
+    parser.add_argument("--tile", type=float, default=TAMANHO_TILE, help="tamanho do tile em graus")
+    parser.add_argument("--raio", type=float, default=RAIO_METROS,
+                        help="distância máxima entre o ponto e a imagem, em metros")
+    parser.add_argument("--lote", type=int, default=500, help="registros por INSERT em urban_images")
+    parser.add_argument("--intervalo-lote", type=float, default=5.0,
+                        help="segundos máximos de um registro no buffer antes de ser gravado")
+    parser.add_argument("--checkpoint", default="ingestao_checkpoint.jsonl",
+                        help="imagens já ingeridas; uma execução interrompida continua de onde parou")
+    args = parser.parse_args()
+
+    configurar_cache(ttl_horas=args.overpass_ttl_horas, offline=args.overpass_offline or None)
+    criar_tabela()
+    if args.amostragem == "grade":
+        regioes = carregar_regioes(args.regioes, args.coluna_regiao)
+        # células que já têm imagem em urban_images não são amostradas de novo
+        ocupadas = celulas_ocupadas(coordenadas_existentes(), args.celula)
+        candidatos = get_coordenadas_array()
+        coordenadas = amostrar_coordenadas(candidatos, regioes, args.celula, args.por_celula, args.por_regiao,
+                                           ocupadas, args.preencher_vazias, args.seed)
+        print(f"🧭 {len(candidatos)} candidatos, {len(ocupadas)} células já com imagens")
+        for regiao, total in sorted(resumo_por_regiao(coordenadas, regioes).items()):
+            print(f"  {regiao}: {total}")
+    else:
+        coordenadas = get_coordenadas(args.limite or None)
+    print(f"📍 {len(coordenadas)} coordenadas")
+    cache = CacheImagens(args.cache, args.cache_dias) if args.descoberta == "tiles" else None
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        ingerir(coordenadas, args.concorrencia, args.rps, cache, args.tile, args.raio, checkpoint,
+                args.lote, args.intervalo_lote)
+    finally:
+        checkpoint.close()
+        if cache is not None:
+            cache.close()
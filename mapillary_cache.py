@@ -0,0 +1,203 @@
+import math
+import sqlite3
+import threading
+import time
+
+# Tamanho padrão dos tiles de descoberta, em graus (~2 km no DF)
+TAMANHO_TILE = 0.02
+# Tiles com mais imagens que o limite da API são divididos em quatro até este tamanho
+TAMANHO_MINIMO_TILE = 0.0025
+RAIO_METROS = 50
+
+METROS_POR_GRAU = 111_320
+
+
+def distancia_metros(lat1, lon1, lat2, lon2):
+    """
+    Distância aproximada (equiretangular), suficiente para dezenas de metros
+    """
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return math.hypot(x, y) * METROS_POR_GRAU
+
+
+def rumo_graus(lat1, lon1, lat2, lon2):
+    """
+    Direção de (lat1, lon1) para (lat2, lon2), 0 = norte, sentido horário
+    """
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def tile_do_ponto(lat, lon, tamanho=TAMANHO_TILE):
+    return (math.floor(lon / tamanho), math.floor(lat / tamanho))
+
+
+def bbox_do_tile(tile, tamanho=TAMANHO_TILE):
+    ix, iy = tile
+    return (ix * tamanho, iy * tamanho, (ix + 1) * tamanho, (iy + 1) * tamanho)
+
+
+def _coordenadas(img):
+    geometria = img.get("computed_geometry") or img.get("geometry")
+    if not geometria:
+        return None
+    lon, lat = geometria["coordinates"][:2]
+    return lat, lon
+
+
+class CacheImagens:
+    """
+    Cache local em SQLite dos metadados de imagens do Mapillary, com um
+    índice espacial R*Tree. Cada tile é buscado na API uma vez (e de novo
+    após `validade_dias`); a escolha da imagem de cada ponto é feita só
+    com consultas locais.
+    """
+
+    def __init__(self, caminho, validade_dias=30):
+        self.caminho = caminho
+        self.validade = validade_dias * 86400
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            " tile TEXT PRIMARY KEY,"
+            " buscado_em REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS imagens ("
+            " rowid INTEGER PRIMARY KEY,"
+            " image_id TEXT UNIQUE NOT NULL,"
+            " lat REAL NOT NULL,"
+            " lon REAL NOT NULL,"
+            " captured_at INTEGER,"
+            " compass_angle REAL,"
+            " thumb_url TEXT)"
+        )
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS imagens_rtree"
+            " USING rtree(rowid, min_lon, max_lon, min_lat, max_lat)"
+        )
+        self.conn.commit()
+
+    def tile_valido(self, chave):
+        with self.lock:
+            linha = self.conn.execute("SELECT buscado_em FROM tiles WHERE tile = ?", (chave,)).fetchone()
+        return linha is not None and time.time() - linha[0] < self.validade
+
+    def salvar_tile(self, chave, imagens):
+        """
+        Grava (ou atualiza) as imagens de um tile e o marca como buscado
+        """
+        with self.lock:
+            for img in imagens:
+                coordenadas = _coordenadas(img)
+                if coordenadas is None:
+                    continue
+                lat, lon = coordenadas
+                angulo = img.get("computed_compass_angle", img.get("compass_angle"))
+                self.conn.execute(
+                    "INSERT INTO imagens (image_id, lat, lon, captured_at, compass_angle, thumb_url)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(image_id) DO UPDATE SET lat = excluded.lat, lon = excluded.lon,"
+                    " captured_at = excluded.captured_at, compass_angle = excluded.compass_angle,"
+                    " thumb_url = excluded.thumb_url",
+                    (str(img["id"]), lat, lon, img.get("captured_at"), angulo, img.get("thumb_2048_url"))
+                )
+                rowid = self.conn.execute("SELECT rowid FROM imagens WHERE image_id = ?",
+                                          (str(img["id"]),)).fetchone()[0]
+                self.conn.execute("INSERT OR REPLACE INTO imagens_rtree VALUES (?, ?, ?, ?, ?)",
+                                  (rowid, lon, lon, lat, lat))
+            self.conn.execute("INSERT OR REPLACE INTO tiles (tile, buscado_em) VALUES (?, ?)",
+                              (chave, time.time()))
+            self.conn.commit()
+
+    def proximas(self, lat, lon, raio_metros=RAIO_METROS):
+        """
+        Imagens a até raio_metros do ponto, como dicts com a distância em metros
+        """
+        dlat = raio_metros / METROS_POR_GRAU
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        with self.lock:
+            linhas = self.conn.execute(
+                "SELECT i.image_id, i.lat, i.lon, i.captured_at, i.compass_angle, i.thumb_url"
+                " FROM imagens_rtree r JOIN imagens i ON i.rowid = r.rowid"
+                " WHERE r.min_lon <= ? AND r.max_lon >= ? AND r.min_lat <= ? AND r.max_lat >= ?",
+                (lon + dlon, lon - dlon, lat + dlat, lat - dlat)
+            ).fetchall()
+        candidatas = []
+        for image_id, img_lat, img_lon, captured_at, angulo, thumb_url in linhas:
+            distancia = distancia_metros(lat, lon, img_lat, img_lon)
+            if distancia <= raio_metros:
+                candidatas.append({"id": image_id, "lat": img_lat, "lon": img_lon, "captured_at": captured_at,
+                                   "compass_angle": angulo, "thumb_2048_url": thumb_url,
+                                   "distancia": distancia})
+        return candidatas
+
+    def melhor_imagem(self, lat, lon, raio_metros=RAIO_METROS, agora=None):
+        """
+        Melhor imagem para o ponto: penaliza distância, idade (até 10 anos)
+        e a câmera não estar virada para o ponto; a de menor penalidade vence.
+
+        Returns:
+            dict | None: imagem escolhida ou None se não houver nenhuma no raio
+        """
+        agora = agora or time.time()
+        melhor, menor = None, None
+        for img in self.proximas(lat, lon, raio_metros):
+            penalidade = img["distancia"] / raio_metros
+            if img["captured_at"]:
+                idade_anos = (agora - img["captured_at"] / 1000) / (365 * 86400)
+                penalidade += min(max(idade_anos, 0), 10) / 10
+            else:
+                penalidade += 1
+            if img["compass_angle"] is not None and img["distancia"] > 1:
+                rumo = rumo_graus(img["lat"], img["lon"], lat, lon)
+                diferenca = abs((img["compass_angle"] - rumo + 180) % 360 - 180)
+                penalidade += diferenca / 180
+            if menor is None or penalidade < menor:
+                melhor, menor = img, penalidade
+        return melhor
+
+    def total_imagens(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM imagens").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def descobrir_tile(cliente, cache, bbox, chave):
+    """
+    Busca as imagens de um tile; se a API indicar que há mais imagens do que
+    o limite de uma resposta, divide o tile em quatro e busca cada parte.
+    Returns o número de chamadas feitas à API.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    imagens, completo = cliente.listar_imagens(bbox)
+    chamadas = 1
+    if not completo and max_lon - min_lon > TAMANHO_MINIMO_TILE:
+        meio_lon, meio_lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+        for i, parte in enumerate([(min_lon, min_lat, meio_lon, meio_lat), (meio_lon, min_lat, max_lon, meio_lat),
+                                   (min_lon, meio_lat, meio_lon, max_lat), (meio_lon, meio_lat, max_lon, max_lat)]):
+            chamadas += descobrir_tile(cliente, cache, parte, f"{chave}/{i}")
+        imagens = []
+    cache.salvar_tile(chave, imagens)
+    return chamadas
+
+
+def tiles_das_coordenadas(coordenadas, tamanho=TAMANHO_TILE, raio_metros=RAIO_METROS):
+    """
+    Tiles da grade que tocam o raio de busca de ao menos uma coordenada
+    """
+    tiles = set()
+    for lat, lon in coordenadas:
+        dlat = raio_metros / METROS_POR_GRAU
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        for dy in (-dlat, dlat):
+            for dx in (-dlon, dlon):
+                tiles.add(tile_do_ponto(lat + dy, lon + dx, tamanho))
+    return sorted(tiles)
@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+GRAPH_URL = "https://graph.mapillary.com/images"
+ENTITY_URL = "https://graph.mapillary.com/{id}"
+
+# Campos pedidos na descoberta em lote (ver mapillary_cache.py)
+CAMPOS_LOTE = "id,thumb_2048_url,computed_geometry,geometry,captured_at,compass_angle,computed_compass_angle"
+# Máximo de imagens por chamada aceito pela API
+LIMITE_LOTE = 2000
+
+# Respostas que valem nova tentativa: limite de requisições e erros do servidor
+STATUS_RETENTATIVA = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Limitador de taxa compartilhado entre threads: até `capacidade` requisições
+    de uma vez, repostas à razão de `taxa` por segundo.
+    """
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1, int(taxa))
+        self.tokens = float(self.capacidade)
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.taxa
+            time.sleep(espera)
+
+
+def criar_sessao(pool_size):
+    """
+    Sessão HTTP com keep-alive e um pool de conexões por host do tamanho da
+    concorrência, para as threads não abrirem uma conexão TLS por requisição.
+    """
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    return sessao
+
+
+class MapillaryClient:
+    """
+    Cliente da Graph API do Mapillary para uso concorrente.
+
+    As chamadas à API passam pelo token bucket (`requisicoes_por_segundo`,
+    abaixo da cota do app); os downloads de thumbnails vão para o CDN e não
+    consomem cota. Respostas 429/5xx e erros de conexão são repetidos com
+    backoff exponencial com jitter, respeitando o Retry-After quando enviado.
+    """
+
+    def __init__(self, access_token, requisicoes_por_segundo=100, concorrencia=16,
+                 tentativas=5, backoff_inicial=1.0, backoff_maximo=60.0, timeout=30):
+        self.access_token = access_token
+        self.bucket = TokenBucket(requisicoes_por_segundo)
+        self.sessao = criar_sessao(concorrencia)
+        self.tentativas = tentativas
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        self.timeout = timeout
+        self.retentativas = 0
+
+    def _espera(self, tentativa, resposta=None):
+        retry_after = resposta.headers.get("Retry-After") if resposta is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_maximo)
+        atraso = min(self.backoff_inicial * 2 ** tentativa, self.backoff_maximo)
+        return random.uniform(atraso / 2, atraso)
+
+    def get(self, url, params=None, limitar=True, stream=False):
+        """
+        GET com rate limit (se `limitar`) e novas tentativas em 429/5xx.
+        Levanta requests.HTTPError quando as tentativas se esgotam.
+        """
+        for tentativa in range(self.tentativas):
+            if limitar:
+                self.bucket.acquire()
+            try:
+                resposta = self.sessao.get(url, params=params, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if tentativa == self.tentativas - 1:
+                    raise
+                resposta = None
+            if resposta is not None and resposta.status_code not in STATUS_RETENTATIVA:
+                resposta.raise_for_status()
+                return resposta
+            if tentativa == self.tentativas - 1:
+                resposta.raise_for_status()
+            self.retentativas += 1
+            if resposta is not None:
+                resposta.close()
+            time.sleep(self._espera(tentativa, resposta))
+
+    def buscar_imagem(self, lat, lon, raio=0.001):
+        """
+        Primeira imagem do Mapillary dentro da caixa de ±raio graus do ponto.
+
+        Returns:
+            dict | None: {"id", "thumb_2048_url"} ou None se não houver imagem
+        """
+        bbox = f"{lon - raio},{lat - raio},{lon + raio},{lat + raio}"
+        params = {
+            "fields": "id,thumb_2048_url",
+            "bbox": bbox,
+            "limit": 1,
+            "access_token": self.access_token
+        }
+        data = self.get(GRAPH_URL, params=params).json()
+        return data["data"][0] if data.get("data") else None
+
+    def listar_imagens(self, bbox):
+        """
+        Metadados de todas as imagens dentro de bbox (min_lon, min_lat, max_lon, max_lat),
+        seguindo a paginação quando a API a envia.
+
+        Returns:
+            tuple: (lista de imagens, completo); completo é False quando a
+            resposta veio cheia e sem próxima página, isto é, pode haver mais
+            imagens na bbox do que as retornadas
+        """
+        params = {
+            "fields": CAMPOS_LOTE,
+            "bbox": ",".join(str(v) for v in bbox),
+            "limit": LIMITE_LOTE,
+            "access_token": self.access_token
+        }
+        imagens = []
+        url = GRAPH_URL
+        while url:
+            data = self.get(url, params=params).json()
+            pagina = data.get("data", [])
+            imagens.extend(pagina)
+            url = data.get("paging", {}).get("next")
+            # a URL de next já traz os parâmetros
+            params = None
+            if url is None and len(pagina) >= LIMITE_LOTE:
+                return imagens, False
+        return imagens, True
+
+    def buscar_thumb(self, image_id):
+        """
+        URL atual do thumbnail de uma imagem (as URLs do CDN expiram)
+        """
+        params = {"fields": "thumb_2048_url", "access_token": self.access_token}
+        return self.get(ENTITY_URL.format(id=image_id), params=params).json()["thumb_2048_url"]
+
+    def abrir_imagem(self, url):
+        """
+        Resposta do thumbnail com o corpo ainda não lido (stream=True), para
+        ser repassada ao MinIO; use com `with` para devolver a conexão ao pool.
+        """
+        return self.get(url, limitar=False, stream=True)
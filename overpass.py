@@ -1,10 +1,16 @@
 # overpass.py
-import requests
 import random
+from overpass_cache import iterar_elementos, coordenadas_dos_elementos
+from indice_regioes import get_indice
 
-def get_coordenadas():
-    overpass_url = "https://overpass-api.de/api/interpreter"
+def get_coordenadas_array():
+    """
+    Coordenadas de comércios, farmácias, bares, cafés e paradas de ônibus das RAs do DF,
+    lidas da resposta em streaming direto para um array (sem a árvore de objetos do JSON).
 
+    Returns:
+        np.ndarray: Array (n, 2) float64 com as colunas lat, lon
+    """
     query = """
     [out:json][timeout:120];
     area["name"="Distrito Federal"][admin_level=4]->.df;
@@ -49,19 +55,28 @@ def get_coordenadas():
     out center;
     """
 
-    response = requests.post(overpass_url, data={"data": query})
-    data = response.json()
+    # resposta reaproveitada do cache em disco, ver overpass_cache.py
+    return coordenadas_dos_elementos(iterar_elementos(query))
+
+def get_coordenadas(limite=20):
+    """
+    Coordenadas de comércios, farmácias, bares, cafés e paradas de ônibus das RAs do DF.
 
-    coordenadas = []
-    for element in data["elements"]:
-        if "lat" in element and "lon" in element:
-            coordenadas.append((element["lat"], element["lon"]))
+    Args:
+        limite (int | None): Quantas coordenadas sortear; None retorna todas
 
-    return random.sample(coordenadas, min(20, len(coordenadas)))
+    Returns:
+        list: Lista de tuplas (lat, lon)
+    """
+    coordenadas = get_coordenadas_array()
+    if limite is not None:
+        coordenadas = coordenadas[random.sample(range(len(coordenadas)), min(limite, len(coordenadas)))]
+    return [tuple(ponto) for ponto in coordenadas.tolist()]
 
 def get_regiao_administrativa(lat, lon):
     """
-    Determina a região administrativa com base nas coordenadas fornecidas.
+    Determina a região administrativa com base nas coordenadas fornecidas,
+    por ponto-em-polígono local sobre regioes_df.geojson (sem rede).
     
     Args:
         lat (float): Latitude
@@ -70,48 +85,22 @@ def get_regiao_administrativa(lat, lon):
     Returns:
         str: Nome da região administrativa ou "Região não identificada"
     """
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    query = f"""
-    [out:json][timeout:30];
-    (
-      is_in({lat}, {lon});
-      area._["name"]["admin_level"];
-    );
-    out tags;
-    """
-    
     try:
-        response = requests.post(overpass_url, data={"data": query})
-        data = response.json()
-        
-        # Lista das regiões administrativas do DF
-        regioes_df = [
-            "Brasília", "Gama", "Taguatinga", "Ceilândia", "Samambaia",
-            "Planaltina", "Paranoá", "Núcleo Bandeirante", "Sobradinho",
-            "Sobradinho II", "Recanto das Emas", "Riacho Fundo",
-            "Riacho Fundo II", "Lago Norte", "Lago Sul", "Candangolândia",
-            "Santa Maria", "São Sebastião", "Cruzeiro", "Sudoeste/Octogonal",
-            "Varjão", "Park Way", "SCIA", "SIA", "Vicente Pires", "Fercal"
-        ]
-        
-        # Procura pela região administrativa nas tags retornadas
-        for element in data.get("elements", []):
-            tags = element.get("tags", {})
-            name = tags.get("name", "")
-            
-            # Verifica se o nome corresponde a uma região administrativa do DF
-            if name in regioes_df:
-                return name
-                
-            # Verifica correspondências parciais (para casos como "Sudoeste/Octogonal")
-            for regiao in regioes_df:
-                if regiao.lower() in name.lower() or name.lower() in regiao.lower():
-                    return regiao
-        
-        return "Região não identificada"
-        
+        return get_regioes_administrativas([lat], [lon])[0]
     except Exception as e:
         print(f"Erro ao consultar região administrativa: {e}")
         return "Erro na consulta"
 
+def get_regioes_administrativas(lats, lons):
+    """
+    Versão vetorizada de get_regiao_administrativa: uma consulta ao
+    STRtree para todos os pontos.
+
+    Args:
+        lats, lons: Arrays (ou listas) de mesmo tamanho
+
+    Returns:
+        list: Nome da região de cada ponto ou "Região não identificada"
+    """
+    regioes = get_indice().consultar(lats, lons)
+    return [regiao if regiao is not None else "Região não identificada" for regiao in regioes]
@@ -0,0 +1,246 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import threading
+from array import array
+import numpy as np
+import requests
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# Configuração padrão, alterável por variáveis de ambiente ou configurar_cache()
+config = {
+    "diretorio": os.getenv("OVERPASS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             ".overpass_cache")),
+    "ttl_segundos": float(os.getenv("OVERPASS_CACHE_TTL_HORAS", 24 * 7)) * 3600,
+    "offline": os.getenv("OVERPASS_OFFLINE", "0") == "1",
+    # pausa mínima entre requisições reais ao overpass-api.de
+    "intervalo_minimo": 0.5,
+}
+
+_lock = threading.Lock()
+_ultima_requisicao = 0.0
+
+
+class RespostaAusenteNoCache(RuntimeError):
+    """
+    Modo offline e a consulta nunca foi feita (ou o cache foi apagado)
+    """
+
+
+class RespostaIncompleta(RuntimeError):
+    """
+    O Overpass respondeu 200 mas com um "remark" de erro de execução
+    (timeout, falta de memória): os elementos vieram pela metade
+    """
+
+
+# o "remark" vem depois de "elements", no fim do corpo
+_REMARK_ERRO = re.compile(rb'"remark"\s*:\s*"(runtime error(?:[^"\\]|\\.)*)"')
+_TAMANHO_FINAL = 1 << 16
+
+
+def _erro_de_execucao(remark):
+    return isinstance(remark, str) and remark.startswith("runtime error")
+
+
+def configurar_cache(diretorio=None, ttl_horas=None, offline=None):
+    if diretorio is not None:
+        config["diretorio"] = diretorio
+    if ttl_horas is not None:
+        config["ttl_segundos"] = ttl_horas * 3600
+    if offline is not None:
+        config["offline"] = offline
+
+
+def normalizar_query(query):
+    """
+    Texto da consulta sem diferenças de indentação e espaços, para que a
+    mesma consulta escrita de outro jeito caia na mesma entrada do cache
+    """
+    linhas = (re.sub(r"\s+", " ", linha).strip() for linha in query.strip().splitlines())
+    return "\n".join(linha for linha in linhas if linha)
+
+
+def chave_da_query(query):
+    return hashlib.sha256(normalizar_query(query).encode("utf-8")).hexdigest()
+
+
+def caminho_no_cache(query):
+    return os.path.join(config["diretorio"], f"{chave_da_query(query)}.json.gz")
+
+
+def _esperar_intervalo():
+    global _ultima_requisicao
+    with _lock:
+        espera = _ultima_requisicao + config["intervalo_minimo"] - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        _ultima_requisicao = time.monotonic()
+
+
+def _baixar(query, caminho, timeout):
+    """
+    Faz a consulta e grava o corpo comprimido, em streaming, sem montar a
+    resposta inteira na memória; a gravação é atômica (arquivo temporário)
+    """
+    _esperar_intervalo()
+    os.makedirs(config["diretorio"], exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    final = b""
+    try:
+        with requests.post(OVERPASS_URL, data={"data": query}, timeout=timeout, stream=True) as resposta:
+            resposta.raise_for_status()
+            with gzip.open(temporario, "wb", compresslevel=6) as f:
+                for bloco in resposta.iter_content(chunk_size=1 << 16):
+                    f.write(bloco)
+                    final = (final + bloco)[-_TAMANHO_FINAL:]
+        # timeout ou falta de memória no servidor chegam como 200 com um
+        # "remark": uma resposta parcial não pode ficar no cache pelo TTL todo
+        erro = _REMARK_ERRO.search(final)
+        if erro:
+            raise RespostaIncompleta(f"Overpass: {erro.group(1).decode('utf-8', 'replace')}")
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def resposta_em_cache(query, ttl_segundos=None, offline=None, timeout=180):
+    """
+    Caminho do arquivo .json.gz com a resposta da consulta, fazendo a
+    requisição só se ela não estiver no cache ou tiver passado do TTL.
+    No modo offline nunca acessa a rede: usa o que houver no cache,
+    mesmo vencido, ou levanta RespostaAusenteNoCache.
+    """
+    ttl_segundos = config["ttl_segundos"] if ttl_segundos is None else ttl_segundos
+    offline = config["offline"] if offline is None else offline
+    caminho = caminho_no_cache(query)
+    existe = os.path.exists(caminho)
+    if existe and (offline or time.time() - os.path.getmtime(caminho) < ttl_segundos):
+        return caminho
+    if offline:
+        raise RespostaAusenteNoCache(f"consulta Overpass fora do cache ({os.path.basename(caminho)})")
+    _baixar(query, caminho, timeout)
+    return caminho
+
+
+_decoder = json.JSONDecoder()
+# fim de um número ou literal (true, false, null), que não têm caractere de fechamento
+_DELIMITADOR = re.compile(r"[,\]}\s]")
+
+
+class _LeitorJSON:
+    """
+    Lê valores JSON de um arquivo de texto aos poucos, mantendo no buffer
+    só o bloco atual e o valor que está sendo decodificado
+    """
+
+    def __init__(self, f, tamanho_bloco):
+        self.f = f
+        self.tamanho_bloco = tamanho_bloco
+        self.buffer = ""
+        self.pos = 0
+
+    def _ler(self):
+        # blocos crescem com o valor pendente, para que um elemento grande
+        # (ex. relation com `out geom`) não seja redecodificado muitas vezes
+        bloco = self.f.read(max(self.tamanho_bloco, len(self.buffer) - self.pos))
+        if not bloco:
+            return False
+        self.buffer = self.buffer[self.pos:] + bloco
+        self.pos = 0
+        return True
+
+    def proximo_caractere(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._ler():
+                return ""
+
+    def consumir(self, esperado):
+        if self.proximo_caractere() != esperado:
+            raise ValueError(f"JSON do Overpass inesperado: esperava {esperado!r} na posição {self.pos}")
+        self.pos += 1
+
+    def valor(self):
+        if self.proximo_caractere() not in '{["':
+            # um número cortado no fim do bloco ("1." de "1.5") seria
+            # decodificado sem erro, então lê até o delimitador que o encerra
+            while not _DELIMITADOR.search(self.buffer, self.pos) and self._ler():
+                pass
+        while True:
+            try:
+                valor, fim = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # objeto ou string que continua no próximo bloco
+                if not self._ler():
+                    raise
+                continue
+            self.pos = fim
+            return valor
+
+
+def iterar_elementos(query, ttl_segundos=None, offline=None, timeout=180, tamanho_bloco=1 << 16):
+    """
+    Elementos da resposta da consulta, um por vez, decodificados direto do
+    arquivo comprimido do cache, sem montar a lista `elements` inteira.
+    """
+    caminho = resposta_em_cache(query, ttl_segundos, offline, timeout)
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        leitor = _LeitorJSON(f, tamanho_bloco)
+        leitor.consumir("{")
+        while leitor.proximo_caractere() != "}":
+            chave = leitor.valor()
+            leitor.consumir(":")
+            if chave == "remark":
+                remark = leitor.valor()
+                if _erro_de_execucao(remark):
+                    # resposta parcial gravada antes da verificação em _baixar
+                    os.remove(caminho)
+                    raise RespostaIncompleta(f"Overpass: {remark}")
+            elif chave != "elements":
+                # version, generator, osm3s: valores pequenos
+                leitor.valor()
+            else:
+                leitor.consumir("[")
+                while leitor.proximo_caractere() != "]":
+                    yield leitor.valor()
+                    if leitor.proximo_caractere() == ",":
+                        leitor.pos += 1
+                leitor.consumir("]")
+            if leitor.proximo_caractere() == ",":
+                leitor.pos += 1
+
+
+def coordenadas_dos_elementos(elementos):
+    """
+    Coordenadas dos elementos com lat/lon (nodes), num buffer float64.
+
+    Returns:
+        np.ndarray: Array (n, 2) com as colunas lat, lon
+    """
+    buffer = array("d")
+    for elemento in elementos:
+        if "lat" in elemento and "lon" in elemento:
+            buffer.append(elemento["lat"])
+            buffer.append(elemento["lon"])
+    return np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+
+
+def geometria_do_elemento(elemento):
+    """
+    Pontos de um elemento com `out geom` (ex. um way).
+
+    Returns:
+        np.ndarray: Array (n, 2) com as colunas lon, lat
+    """
+    geometria = elemento.get("geometry") or []
+    valores = (v for ponto in geometria for v in (ponto["lon"], ponto["lat"]))
+    return np.fromiter(valores, dtype=np.float64, count=2 * len(geometria)).reshape(-1, 2)
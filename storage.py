@@ -9,6 +9,9 @@ MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 BUCKET_NAME = os.getenv("MINIO_BUCKET")
 
+# Tamanho das partes do upload multipart (o mínimo do S3 é 5 MiB)
+PART_SIZE = 10 * 1024 * 1024
+
 minio_client = Minio(
     MINIO_ENDPOINT,
     access_key=MINIO_ACCESS_KEY,
@@ -24,3 +27,33 @@ def upload_imagem(local_path: str, object_name: str):
         content_type="image/jpeg"
     )
     os.remove(local_path)
+
+def upload_stream(stream, object_name: str, tamanho: int = -1, content_type: str = "image/jpeg"):
+    """
+    Envia um objeto lendo de um stream, sem passar pelo disco.
+
+    Com `tamanho` conhecido e menor que PART_SIZE é um único PUT; objetos
+    maiores, ou de tamanho desconhecido (-1), vão em upload multipart de
+    PART_SIZE bytes por parte, então a memória usada fica limitada a uma parte.
+    """
+    return minio_client.put_object(
+        BUCKET_NAME,
+        object_name,
+        stream,
+        length=tamanho,
+        content_type=content_type,
+        part_size=PART_SIZE
+    )
+
+def upload_resposta(resposta, object_name: str):
+    """
+    Envia ao MinIO o corpo de uma resposta do requests aberta com stream=True,
+    direto do socket para o put_object.
+    """
+    # Content-Length só vale como tamanho do corpo quando não há compressão
+    tamanho = resposta.headers.get("Content-Length")
+    if tamanho is None or resposta.headers.get("Content-Encoding"):
+        tamanho = -1
+    resposta.raw.decode_content = True
+    content_type = resposta.headers.get("Content-Type", "image/jpeg").split(";")[0]
+    return upload_stream(resposta.raw, object_name, int(tamanho), content_type)